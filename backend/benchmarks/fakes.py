@@ -0,0 +1,302 @@
+"""
+ベンチマーク用のローカル代替 (Gemini / Drive / Slides)
+- 応答遅延 (latency) とエラー率 (error_rate) を設定可能
+- API 呼び出し回数を CallStats に集計する
+"""
+import asyncio
+import base64
+import itertools
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# 1x1 の透明 PNG
+TINY_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class CallStats:
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+class FakeBehavior:
+    """ 遅延 (秒) とエラー率 (0.0-1.0) の設定 """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def random_bytes(self, n):
+        """ --seed で再現できるよう、画像の画素もこの乱数列から作る """
+        with self._lock:
+            return self._random.randbytes(n)
+
+
+stats = CallStats()
+
+
+_png_serial = itertools.count()
+
+def unique_png(behavior, size=16):
+    """
+    重複排除インデックス / 画像キャッシュに当たらないよう、画素そのものが毎回異なる PNG
+    (末尾にノンスを付けるだけだと再エンコードで消えて同じ画像になる)
+    画素は behavior の乱数 (seed 固定) から作る
+    """
+    serial = next(_png_serial)
+    pixels = bytearray(behavior.random_bytes(size * size * 3))
+    pixels[:8] = struct.pack(">Q", serial)
+    row_bytes = size * 3
+    raw = b"".join(b"\x00" + bytes(pixels[y * row_bytes:(y + 1) * row_bytes]) for y in range(size))
+
+    def _chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", header) + _chunk(b"IDAT", zlib.compress(raw)) + _chunk(b"IEND", b"")
+
+
+# --- 🤖 Gemini ---
+
+class _InlineData:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Part:
+    def __init__(self, data):
+        self.inline_data = _InlineData(data)
+
+
+class _Response:
+    def __init__(self, text="", image=None):
+        self.text = text
+        self.parts = [_Part(image)] if image is not None else []
+
+
+class _RetryableModelError(Exception):
+    code = 503
+
+
+class FakeGenerativeModel:
+    """ genai.GenerativeModel の代替。モデル名で text / image / vision を切り替える """
+
+    behavior = FakeBehavior()
+    slide_count = 5
+    element_count = 20
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+
+    def _respond(self, contents):
+        stats.add(f"gemini:{self.model_name}")
+        if self.behavior.should_fail():
+            raise _RetryableModelError("fake 503")
+        if "image" in self.model_name:
+            return _Response(image=unique_png(self.behavior))
+        if isinstance(contents, list):
+            return _Response(text=json.dumps(make_layout(self.element_count)))
+        return _Response(text=json.dumps(make_draft(self.slide_count), ensure_ascii=False))
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        time.sleep(self.behavior.delay())
+        return self._respond(contents)
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        await asyncio.sleep(self.behavior.delay())
+        response = self._respond(contents)
+        if stream:
+            return _FakeStream(response.text)
+        return response
+
+
+class _FakeStream:
+    def __init__(self, text, chunk_size=64):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(0)
+            yield _Response(text=chunk)
+
+
+# --- 📁 Drive / 📊 Slides ---
+
+class _Request:
+    def __init__(self, name, behavior, result):
+        self.name = name
+        self.behavior = behavior
+        self.result = result
+
+    def execute(self):
+        stats.add(self.name)
+        time.sleep(self.behavior.delay())
+        if self.behavior.should_fail():
+            raise HttpError(httplib2.Response({"status": 503}), b"fake 503", uri=self.name)
+        return self.result() if callable(self.result) else self.result
+
+
+class _BatchRequest:
+    def __init__(self, behavior, callback):
+        self.behavior = behavior
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        stats.add("drive.batch")
+        time.sleep(self.behavior.delay())
+        for request_id, request in self.requests:
+            self.callback(request_id, request.result() if callable(request.result) else request.result, None)
+
+
+class FakeDriveService:
+    _ids = itertools.count()
+
+    def __init__(self, behavior):
+        self.behavior = behavior
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def files(self):
+        return self
+
+    def permissions(self):
+        return self
+
+    def about(self):
+        return self
+
+    def get(self, fileId=None, fields=None):
+        if fileId is not None:
+            return _Request("drive.files.get", self.behavior, {
+                "id": fileId, "trashed": False, "thumbnailLink": f"https://fake.local/{fileId}=s220",
+            })
+        return _Request("drive.about.get", self.behavior, {"user": {"permissionId": "bench-user"}})
+
+    def list(self, q=None, spaces=None, fields=None):
+        return _Request("drive.files.list", self.behavior, {"files": []})
+
+    def create(self, body=None, media_body=None, fields=None, fileId=None):
+        if fileId is not None:
+            return _Request("drive.permissions.create", self.behavior, {"id": self._new_id("perm")})
+        if media_body is None:
+            return _Request("drive.files.create(folder)", self.behavior, lambda: {"id": self._new_id("folder")})
+
+        def _upload():
+            file_id = self._new_id("file")
+            return {"id": file_id, "thumbnailLink": f"https://fake.local/{file_id}=s220"}
+        return _Request("drive.files.create(upload)", self.behavior, _upload)
+
+    def new_batch_http_request(self, callback=None):
+        return _BatchRequest(self.behavior, callback)
+
+    def close(self):
+        pass
+
+
+class FakeSlidesService:
+    _ids = itertools.count()
+
+    def __init__(self, behavior):
+        self.behavior = behavior
+        self.requests_sent = 0
+
+    def presentations(self):
+        return self
+
+    def create(self, body=None):
+        pres_id = f"pres_{next(self._ids)}"
+        return _Request("slides.presentations.create", self.behavior, {"presentationId": pres_id, "slides": [{"objectId": "p0"}]})
+
+    def batchUpdate(self, presentationId=None, body=None):
+        n = len((body or {}).get("requests", []))
+        stats.add("slides.request_items", n)
+        return _Request("slides.presentations.batchUpdate", self.behavior, {"replies": [{}] * n})
+
+    def get(self, presentationId=None, fields=None):
+        return _Request("slides.presentations.get", self.behavior, {"slides": []})
+
+    def close(self):
+        pass
+
+
+# --- 🧾 Sample Data ---
+
+def make_draft(slide_count):
+    return {
+        "slides": [
+            {"title": f"Slide {i+1}", "content": f"【要素】: 内容 {i+1}", "visual_prompt": f"【役割】 デザイナー {i+1}"}
+            for i in range(slide_count)
+        ]
+    }
+
+def make_layout(element_count, diagram_every=0):
+    elements = []
+    for i in range(element_count):
+        row, col = divmod(i, 6)
+        bbox = [20 + col * 150, 20 + (row % 8) * 60, 140, 50]
+        kind = i % 3
+        if diagram_every and i % diagram_every == diagram_every - 1:
+            elements.append({"type": "diagram_image", "prompt": f"isometric diagram {i}", "bbox": bbox})
+        elif kind == 0:
+            elements.append({"type": "text", "text": f"Text {i}", "color": "#333333", "fontSize": 18,
+                             "fontWeight": "bold", "align": "center", "bbox": bbox})
+        elif kind == 1:
+            elements.append({"type": "shape", "shape_type": "ROUND_RECTANGLE", "color": "#82BE28", "opacity": 0.8, "bbox": bbox})
+        else:
+            elements.append({"type": "icon", "icon_name": "cloud", "color": "#F5E100", "bbox": bbox})
+    return {"background_color": "#FFFFFF", "elements": elements}
+
+def make_slides(deck_size, element_count, vector_ratio=0.5, diagram_every=0, behavior=None):
+    behavior = behavior or FakeGenerativeModel.behavior
+    slides = []
+    for i in range(deck_size):
+        slide = {
+            "title": f"Slide {i+1}",
+            "content": "...",
+            "backgroundImage": base64.b64encode(unique_png(behavior)).decode("utf-8"),
+        }
+        if i < deck_size * vector_ratio:
+            slide["remake_data"] = make_layout(element_count, diagram_every)
+        slides.append(slide)
+    return slides
@@ -0,0 +1,233 @@
+"""
+オフラインベンチマーク (外部 API 不要)
+
+    cd backend
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json
+
+Gemini / Drive / Slides はローカル代替 (benchmarks/fakes.py) に差し替え、
+遅延とエラー率を指定して export_slides_endpoint / create_presentation_from_drive_images /
+_add_remake_requests を計測する。結果は JSON (スループット, p50/p99, API 呼び出し回数, ピークメモリ)。
+各反復の前にキャッシュ (画像 / レイアウト / アップロード索引 / フォルダID) を空にする。
+--warm を付けるとキャッシュを残したまま計測する (シナリオの最初に1回だけ未計測で温める)。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import tracemalloc
+
+# キャッシュ類はベンチ専用の一時ディレクトリへ (services の import より前に設定する)
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="cyberslide-bench-"))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from benchmarks import fakes  # noqa: E402
+from services import ai_service, google_service, rate_limit  # noqa: E402
+from services.upload_index import UploadIndex  # noqa: E402
+
+TOKEN = "bench-token"
+
+
+def setup_fakes(latency: float, error_rate: float, seed: int):
+    behavior = fakes.FakeBehavior(latency=latency, jitter=latency * 0.2, error_rate=error_rate, seed=seed)
+    fakes.FakeGenerativeModel.behavior = behavior
+    ai_service._genai_module = types.SimpleNamespace(GenerativeModel=fakes.FakeGenerativeModel)
+    google_service._get_drive_service = lambda creds: fakes.FakeDriveService(behavior)
+    google_service._get_slides_service = lambda creds: fakes.FakeSlidesService(behavior)
+
+    # クォータ制御はベンチ対象外: 十分大きくしてリトライ待ちも短くする
+    unlimited = {"qps": 1e6, "burst": 10 ** 6, "max_concurrency": 10 ** 4}
+    rate_limit.DEFAULT_MODEL_LIMIT.update(unlimited)
+    for limits in rate_limit.DEFAULT_LIMITS.values():
+        limits.update(unlimited)
+    rate_limit.RETRY_BASE_DELAY = latency
+    rate_limit.RETRY_MAX_DELAY = latency * 8
+
+
+def reset_caches():
+    """ 前の反復 / シナリオの結果が当たらないよう、キャッシュ類を新しい一時ディレクトリに切り替える """
+    root = tempfile.mkdtemp(prefix="cyberslide-bench-cache-", dir=os.environ["CACHE_DIR"])
+    for cache in (ai_service.image_cache, ai_service.layout_cache):
+        cache.dir = os.path.join(root, cache.name)
+        cache.hits = cache.misses = 0
+    google_service.upload_index = UploadIndex(os.path.join(root, "upload_index.sqlite3"))
+    google_service.folder_cache = google_service.FolderIdCache()
+
+
+# --- 📏 Measurement ---
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+def measure(name, params, run_once, iterations, units, warm=False):
+    """
+    run_once() を iterations 回実行して統計を取る。units は1回あたりの処理量 (スライド数など)
+    warm=False なら反復ごとにキャッシュを空にする
+    """
+    reset_caches()
+    if warm:
+        run_once()
+    latencies = []
+    calls = []
+    for _ in range(iterations):
+        if not warm:
+            reset_caches()
+        fakes.stats.reset()
+        start = time.perf_counter()
+        run_once()
+        latencies.append(time.perf_counter() - start)
+        calls.append(fakes.stats.snapshot())
+
+    # メモリは計測のオーバーヘッドを避けるため別に1回だけ
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    run_once()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    api_calls = {}
+    for snapshot in calls:
+        for key, value in snapshot.items():
+            api_calls[key] = api_calls.get(key, 0) + value / iterations
+
+    return {
+        "scenario": name,
+        "params": params,
+        "iterations": iterations,
+        "warm": warm,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "mean": statistics.mean(latencies) * 1000,
+        },
+        "throughput_per_s": units / statistics.mean(latencies),
+        "api_calls_per_iteration": {k: round(v, 2) for k, v in sorted(api_calls.items())},
+        "peak_memory_bytes": peak,
+    }
+
+
+# --- 🧪 Scenarios ---
+
+def bench_remake_requests(element_count, iterations, warm=False):
+    layout = fakes.make_layout(element_count)
+
+    def run_once():
+        requests = []
+        google_service._add_remake_requests(requests, "bench_page", layout, TOKEN, "folder", diagram_urls={})
+        fakes.stats.add("slides.request_items(built)", len(requests))
+
+    return measure("add_remake_requests", {"elements": element_count}, run_once, iterations, element_count, warm)
+
+def bench_create_presentation(deck_size, element_count, iterations, warm=False):
+    slides = fakes.make_slides(deck_size, element_count, diagram_every=10)
+    for slide in slides:
+        slide.pop("backgroundImage")
+        slide["drive_url"] = "https://fake.local/bg=s3000"
+
+    def run_once():
+        google_service.create_presentation_from_drive_images(TOKEN, "Bench", slides)
+
+    params = {"deck_size": deck_size, "elements": element_count}
+    return measure("create_presentation_from_drive_images", params, run_once, iterations, deck_size, warm)
+
+def bench_export_endpoint(deck_size, element_count, iterations, warm=False):
+    import main
+
+    def run_once():
+        slides = fakes.make_slides(deck_size, element_count, diagram_every=10)
+        req = main.ExportRequest(title="Bench", slides=slides)
+        asyncio.run(main.export_slides_endpoint(req, authorization=f"Bearer {TOKEN}"))
+
+    params = {"deck_size": deck_size, "elements": element_count}
+    return measure("export_slides_endpoint", params, run_once, iterations, deck_size, warm)
+
+
+# --- 🧾 Report ---
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline_path):
+    """ 同じシナリオ / パラメータ同士で p50 を比較して表示する """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    index = {(r["scenario"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    for r in current["results"]:
+        base = index.get((r["scenario"], json.dumps(r["params"], sort_keys=True)))
+        if not base:
+            continue
+        ratio = r["latency_ms"]["p50"] / max(base["latency_ms"]["p50"], 1e-9)
+        print(f"{r['scenario']:<40} {json.dumps(r['params']):<36} p50 {base['latency_ms']['p50']:9.1f}ms -> "
+              f"{r['latency_ms']['p50']:9.1f}ms ({ratio:.2f}x)", file=sys.stderr)
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="CyberSlide backend offline benchmarks")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake API latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake retryable error rate (0.0-1.0)")
+    parser.add_argument("--deck-sizes", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--element-counts", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--scenarios", nargs="+", default=["remake", "create", "export"],
+                        choices=["remake", "create", "export"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="keep caches between iterations (measure the cached path)")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON to compare p50 latency against")
+    parser.add_argument("--verbose", action="store_true", help="keep service INFO logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    setup_fakes(args.latency_ms / 1000, args.error_rate, args.seed)
+
+    results = []
+    if "remake" in args.scenarios:
+        for n in args.element_counts:
+            results.append(bench_remake_requests(n, args.iterations, args.warm))
+    if "create" in args.scenarios:
+        for size in args.deck_sizes:
+            results.append(bench_create_presentation(size, args.element_counts[0], args.iterations, args.warm))
+    if "export" in args.scenarios:
+        for size in args.deck_sizes:
+            results.append(bench_export_endpoint(size, args.element_counts[0], args.iterations, args.warm))
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "timestamp": time.time(),
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+            "warm": args.warm,
+        },
+        "results": results,
+    }
+
+    body = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(body)
+    else:
+        print(body)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,9 +1,47 @@
-from fastapi import FastAPI, HTTPException, Header
+import os
+import time
+
+# 起動時間の計測 (モジュール import の開始)
+_IMPORT_STARTED = time.perf_counter()
+
+def _load_env_file():
+    """
+    .env はサービスの設定値 (各モジュールが import 時に読む) より先に読み込む
+    backend/ から親ディレクトリへ探し、見つからなければ dotenv 自体を読み込まない
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+_load_env_file()
+
+from fastapi import FastAPI, HTTPException, Header, Request, UploadFile, File
 from pydantic import BaseModel
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from services import ai_service, google_service
+from services.executor import shutdown_executor, run_blocking
+from services.export_jobs import export_jobs, JobLimitExceeded
+from services.image_pipeline import shutdown_pipeline
+from services.metrics import correlation_id, new_correlation_id, span, render_metrics, record_startup
+from services.schemas import (
+    DraftResult, LayoutResult, BatchLayoutResult, ExportResult, ExportJobAccepted, ExportJobStatus,
+)
+from services.speculative_images import speculative_images
+from services.warmup import warmup, WARMUP_ON_STARTUP
 import uvicorn
-import os
+import orjson
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 app = FastAPI()
 
@@ -16,75 +54,341 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def _correlation_id_middleware(request: Request, call_next):
+    """ リクエストごとに相関IDを振り、ログ / トレースとレスポンスヘッダーに載せる """
+    cid = request.headers.get("X-Request-ID") or new_correlation_id()
+    ctx_token = correlation_id.set(cid)
+    try:
+        response = await call_next(request)
+    finally:
+        correlation_id.reset(ctx_token)
+    response.headers["X-Request-ID"] = cid
+    return response
+
+@app.on_event("startup")
+def _startup():
+    record_startup("import", _IMPORT_SECONDS)
+    started = time.perf_counter()
+    export_jobs.start()
+    record_startup("startup_hooks", time.perf_counter() - started)
+    # 重い SDK の読み込み等はバックグラウンドで (完了までは /api/ready が 503)
+    if WARMUP_ON_STARTUP:
+        warmup.start_background()
+
+@app.on_event("shutdown")
+def _shutdown():
+    export_jobs.shutdown()
+    speculative_images.shutdown()
+    shutdown_pipeline()
+    shutdown_executor()
+
 # --- Request Models ---
 
 class Step1Request(BaseModel):
     title: str
     count: int = 5
     is_locked: bool = False # ★追加: ロックモードフラグ
+    stream: bool = False # スライドを1枚ずつ NDJSON で返す
+    speculate_images: bool = False # visual_prompt の画像を先回りで生成しておく (Step 3 で即答)
+
+class SpeculationUpdateRequest(BaseModel):
+    prompts: List[str]
 
 class Step3Request(BaseModel):
     image_base64: str
 
+class BatchLayoutRequest(BaseModel):
+    images_base64: List[str]
+    batch_size: Optional[int] = None
+
+class BatchImageRequest(BaseModel):
+    prompts: List[str]
+    force_refresh: bool = False
+    concurrency: Optional[int] = None
+
 class ExportRequest(BaseModel):
     title: str
     slides: list
+    # 指定すると既存のプレゼンテーションを差分更新する (変更のあったスライドのみ再描画)
+    presentation_id: Optional[str] = None
 
 # --- API Endpoints ---
 
-@app.post("/api/step1-draft")
+def _bearer_token(authorization: Optional[str]):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="No token provided")
+    return authorization.replace("Bearer ", "")
+
+async def _build_presentation(token: str, title: str, slides: list, presentation_id: Optional[str], background_files: dict = None):
+    """
+    背景画像をアップロードしてスライドを作る。戻り値はレスポンス用 dict
+    presentation_id があれば差分更新: 先に差分を取り、追加 / 変更されたスライドの背景だけをアップロードする
+    送信前に修復 / 除外した要素 (preflight) はスライドごとに diagnostics で返す
+    """
+    diagnostics = []
+
+    def _progress(event):
+        if event.get("stage") == "preflight":
+            diagnostics.append({"index": event["index"], "diagnostics": event["diagnostics"]})
+
+    if not presentation_id:
+        folder_id = await google_service.get_or_create_project_folder_async(token)
+        processed_slides = await google_service.upload_slide_backgrounds_async(
+            token, folder_id, slides, background_files=background_files
+        )
+        pres_id = await google_service.create_presentation_from_drive_images_async(token, title, processed_slides, _progress)
+        return {"status": "success", "url": f"https://docs.google.com/presentation/d/{pres_id}/edit", "diagnostics": diagnostics}
+    try:
+        slides = await run_blocking(google_service.with_background_hashes, slides, background_files)
+        plan = await google_service.plan_presentation_update_async(token, presentation_id, slides)
+        if plan["changed"]:
+            folder_id = await google_service.get_or_create_project_folder_async(token)
+            slides = await google_service.upload_slide_backgrounds_async(
+                token, folder_id, slides, background_files=background_files, only=set(plan["changed"])
+            )
+        pres_id, changes = await google_service.update_presentation_from_drive_images_async(
+            token, presentation_id, slides, _progress, plan
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="No access to presentation")
+    return {"status": "success", "url": f"https://docs.google.com/presentation/d/{pres_id}/edit", "changes": changes, "diagnostics": diagnostics}
+
+@app.post("/api/step1-draft", response_model=DraftResult, response_model_exclude_none=True)
 async def step1_draft(req: Step1Request):
+    if req.stream:
+        async def _stream():
+            index = 0
+            speculation_id = speculative_images.start() if req.speculate_images else None
+            try:
+                async for slide in ai_service.stream_draft_concept(req.title, req.count, req.is_locked):
+                    if speculation_id:
+                        speculative_images.add(speculation_id, index, slide.get("visual_prompt"))
+                    yield orjson.dumps({"index": index, "slide": slide}) + b"\n"
+                    index += 1
+            except Exception:
+                # 途中で失敗した構成案は完了扱いにしない (先回り生成も取り消す)
+                if speculation_id:
+                    speculative_images.cancel(speculation_id)
+                yield orjson.dumps({"status": "error", "count": index, "detail": "構成案の生成に失敗しました"}) + b"\n"
+                return
+            done = {"status": "done", "count": index}
+            if speculation_id:
+                done["speculation_id"] = speculation_id
+            yield orjson.dumps(done) + b"\n"
+        return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
     # ロックフラグを ai_service に渡す
-    data = ai_service.generate_draft_concept(req.title, req.count, req.is_locked)
-    return {"status": "success", "data": data}
+    data = await ai_service.generate_draft_concept_async(req.title, req.count, req.is_locked)
+    result = {"status": "success", "data": data}
+    if req.speculate_images:
+        result["speculation_id"] = speculative_images.start(
+            [slide.get("visual_prompt") for slide in data.get("slides", [])]
+        )
+    return result
+
+# --- Speculative Images (Step 2 で編集中に先回り生成) ---
+
+@app.put("/api/speculation/{speculation_id}")
+async def update_speculation(speculation_id: str, req: SpeculationUpdateRequest):
+    """ Step 2 でプロンプトが編集されたら呼ぶ (変わったプロンプトだけ取り消し & 再生成) """
+    try:
+        speculative_images.update(speculation_id, req.prompts)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Speculation not found")
+    return speculative_images.status(speculation_id)
+
+@app.get("/api/speculation/{speculation_id}")
+async def get_speculation(speculation_id: str):
+    status = speculative_images.status(speculation_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Speculation not found")
+    return status
+
+@app.delete("/api/speculation/{speculation_id}")
+async def cancel_speculation(speculation_id: str):
+    try:
+        speculative_images.cancel(speculation_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Speculation not found")
+    return {"status": "cancelled"}
+
+async def _image_bytes(prompt: str, use_cache: bool):
+    """ 先回り生成中ならその完了を待ってから生成 (= 画像キャッシュから即答) """
+    if use_cache:
+        await speculative_images.wait_for(prompt)
+    return await ai_service.generate_image_bytes_async(prompt, use_cache=use_cache)
 
 @app.post("/api/step3-gen-image")
 async def step3_gen_image(req: dict): 
-    # { prompt: str }
+    # { prompt: str, force_refresh?: bool }
     prompt = req.get("prompt", "")
-    img_b64 = ai_service.generate_image(prompt)
+    use_cache = not req.get("force_refresh", False)
+    img_b64 = ai_service._to_base64(await _image_bytes(prompt, use_cache))
     if not img_b64:
         raise HTTPException(status_code=500, detail="画像の生成に失敗しました")
     return {"image_base64": img_b64}
 
-@app.post("/api/step3-analyze-layout")
+@app.post("/api/step3-gen-image/binary")
+async def step3_gen_image_binary(req: dict):
+    """ 生成画像を base64 JSON ではなく image/png のバイナリで返す """
+    prompt = req.get("prompt", "")
+    use_cache = not req.get("force_refresh", False)
+    img_bytes = await _image_bytes(prompt, use_cache)
+    if not img_bytes:
+        raise HTTPException(status_code=500, detail="画像の生成に失敗しました")
+    return Response(content=img_bytes, media_type="image/png")
+
+@app.post("/api/step3-gen-images")
+async def step3_gen_images(req: BatchImageRequest):
+    """ 全スライドの画像を一括生成し、完成した順に NDJSON で返す """
+    if len(req.prompts) > ai_service.IMAGE_BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"prompts は {ai_service.IMAGE_BATCH_MAX_PROMPTS} 件までです")
+    # クライアント指定の同時実行数はサーバー側の上限を超えさせない
+    concurrency = max(1, min(req.concurrency or ai_service.IMAGE_BATCH_CONCURRENCY, ai_service.IMAGE_BATCH_CONCURRENCY))
+
+    async def _stream():
+        async for index, img_b64 in ai_service.generate_images_as_completed(
+            req.prompts, max_concurrency=concurrency, use_cache=not req.force_refresh
+        ):
+            if img_b64:
+                line = {"index": index, "status": "success", "image_base64": img_b64}
+            else:
+                line = {"index": index, "status": "error", "detail": "画像の生成に失敗しました"}
+            yield orjson.dumps(line) + b"\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/step3-analyze-layout", response_model=LayoutResult)
 async def step3_analyze(req: Step3Request):
-    data = ai_service.analyze_slide_for_remake(req.image_base64)
+    data = await ai_service.analyze_slide_for_remake_async(req.image_base64)
     return {"status": "success", "layout": data}
 
-@app.post("/api/export")
+@app.post("/api/step3-analyze-layouts", response_model=BatchLayoutResult)
+async def step3_analyze_batch(req: BatchLayoutRequest):
+    """ デッキ全体のレイアウト解析 (batch_size 枚ずつ1回の vision リクエストにまとめる) """
+    layouts = await ai_service.analyze_slides_for_remake_batch_async(req.images_base64, req.batch_size)
+    return {"status": "success", "layouts": layouts}
+
+@app.post("/api/step3-analyze-layout/upload", response_model=LayoutResult)
+async def step3_analyze_upload(file: UploadFile = File(...)):
+    """ multipart で画像を受け取る版 (SpooledTemporaryFile → バイト列1回だけ読み込み) """
+    mime_type = file.content_type if (file.content_type or "").startswith("image/") else "image/png"
+    image_bytes = await file.read()
+    await file.close()
+    data = await ai_service.analyze_slide_bytes_for_remake_async(image_bytes, mime_type)
+    return {"status": "success", "layout": data}
+
+@app.post("/api/export", response_model=ExportResult, response_model_exclude_none=True)
 async def export_slides_endpoint(req: ExportRequest, authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="No token provided")
-    
-    token = authorization.replace("Bearer ", "")
+    token = _bearer_token(authorization)
     
-    # Driveフォルダ準備
-    folder_id = google_service.get_or_create_project_folder(token)
+    with span("export", "sync"):
+        # 画像アップロード (並列・順序維持) & スライド作成 (presentation_id 指定時は差分更新)
+        result = await _build_presentation(token, req.title, req.slides, req.presentation_id)
     
-    # 画像アップロード & URL置換
-    processed_slides = []
-    for i, slide in enumerate(req.slides):
-        new_slide = slide.copy()
-        
-        # 背景画像がある場合、Driveにアップロード
-        if slide.get("backgroundImage"):
-            # ファイル名を一意にするためタイムスタンプなどを入れるのが理想だが、簡易的にindexで
-            res = google_service.upload_image_to_drive(
-                token, 
-                folder_id, 
-                slide["backgroundImage"], 
-                f"slide_bg_{i}.png"
+    return result
+
+@app.post("/api/export/multipart", response_model=ExportResult, response_model_exclude_none=True)
+async def export_slides_multipart(request: Request, authorization: str = Header(None)):
+    """
+    multipart/form-data 版エクスポート
+    - title: タイトル / slides: スライド JSON (backgroundImage 無し)
+    - presentation_id: (任意) 差分更新する既存のプレゼンテーション
+    - background_{index}: 各スライドの背景画像ファイル (一時ファイルのまま Drive へストリーム送信)
+    """
+    token = _bearer_token(authorization)
+    form = await request.form()
+    try:
+        title = form.get("title", "")
+        try:
+            slides = orjson.loads(form.get("slides") or "[]")
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="slides must be JSON")
+
+        background_files = {}
+        for key, value in form.multi_items():
+            if key.startswith("background_") and hasattr(value, "file"):
+                try:
+                    background_files[int(key[len("background_"):])] = value.file
+                except ValueError:
+                    raise HTTPException(status_code=400, detail=f"Invalid field: {key}")
+
+        with span("export", "multipart"):
+            result = await _build_presentation(
+                token, title, slides, form.get("presentation_id") or None, background_files=background_files
             )
-            if res:
-                new_slide["drive_url"] = res["url"]
-        
-        processed_slides.append(new_slide)
+    finally:
+        await form.close()
 
-    # スライド作成
-    pres_id = google_service.create_presentation_from_drive_images(token, req.title, processed_slides)
-    
-    return {"status": "success", "url": f"https://docs.google.com/presentation/d/{pres_id}/edit"}
+    return result
+
+# --- Export Jobs (非同期エクスポート) ---
+
+@app.post("/api/export-jobs", response_model=ExportJobAccepted)
+async def submit_export_job(req: ExportRequest, authorization: str = Header(None)):
+    token = _bearer_token(authorization)
+    try:
+        job_id = await run_blocking(export_jobs.submit, token, req.title, req.slides, req.presentation_id)
+    except JobLimitExceeded:
+        raise HTTPException(status_code=429, detail="実行中のエクスポートが多すぎます")
+    return {"status": "accepted", "job_id": job_id}
+
+@app.get("/api/export-jobs/{job_id}", response_model=ExportJobStatus)
+async def get_export_job(job_id: str, authorization: str = Header(None)):
+    token = _bearer_token(authorization)
+    status = await run_blocking(export_jobs.status, job_id, token)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.get("/api/export-jobs/{job_id}/result", response_model=ExportResult, response_model_exclude_none=True)
+async def get_export_job_result(job_id: str, authorization: str = Header(None)):
+    token = _bearer_token(authorization)
+    job = await run_blocking(export_jobs.get, job_id, token)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {"status": "success", **job["result"]}
+
+@app.post("/api/export-jobs/{job_id}/resume", response_model=ExportJobAccepted)
+async def resume_export_job(job_id: str, authorization: str = Header(None)):
+    token = _bearer_token(authorization)
+    try:
+        await run_blocking(export_jobs.resume, job_id, token)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Not your job")
+    except JobLimitExceeded:
+        raise HTTPException(status_code=429, detail="実行中のエクスポートが多すぎます")
+    return {"status": "accepted", "job_id": job_id}
+
+# --- Readiness / Warm-up ---
+
+@app.get("/api/ready")
+async def ready():
+    """ レディネスプローブ: ウォームアップが終わるまで 503 (ロードバランサーはトラフィックを流さない) """
+    report = {**warmup.report(), "import_seconds": _IMPORT_SECONDS}
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+@app.post("/api/warmup")
+async def run_warmup(network: bool = False):
+    """ ウォームアップを明示的に実行 (network=true で Gemini への接続確立まで行う) """
+    report = await run_blocking(warmup.run, network)
+    return {**report, "import_seconds": _IMPORT_SECONDS}
+
+# --- Observability ---
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,25 +1,71 @@
 import os
-import json
+import asyncio
 import re
 import base64
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+import hashlib
+import threading
+import orjson
+from pydantic import ValidationError
+from services.disk_cache import DiskCache, make_key
+from services.executor import run_blocking
+from services.metrics import span
+from services.rate_limit import get_limiter
+from services.schemas import (
+    DRAFT_RESPONSE_SCHEMA, LAYOUT_RESPONSE_SCHEMA, LAYOUT_BATCH_RESPONSE_SCHEMA,
+    DraftResponse, DraftSlide, LayoutResponse, BatchLayoutResponse,
+)
+from services.image_pipeline import prepare_for_vision, prepare_for_vision_async
 
 # --- 🤖 Model Definitions ---
 TEXT_MODEL_NAME = "models/gemini-3-pro-preview"
 IMAGE_MODEL_NAME = "models/gemini-3-pro-image-preview" 
 VISION_MODEL_NAME = "models/gemini-3-pro-preview"
 
+# --- 📦 SDK の遅延読み込み (import が重いので初回のモデル呼び出し / ウォームアップ時に読み込む) ---
+_genai_module = None
+_genai_lock = threading.Lock()
+
+def _genai():
+    """ google.generativeai を読み込んで configure 済みのモジュールを返す """
+    global _genai_module
+    if _genai_module is None:
+        with _genai_lock:
+            if _genai_module is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai_module = genai
+    return _genai_module
+
+# --- 📐 Structured Output (JSON スキーマで出力を制約) ---
+DRAFT_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": DRAFT_RESPONSE_SCHEMA}
+LAYOUT_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": LAYOUT_RESPONSE_SCHEMA}
+LAYOUT_BATCH_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": LAYOUT_BATCH_RESPONSE_SCHEMA}
+
+# 一括画像生成時の同時実行数
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+# 一括画像生成で1回に受け付けるプロンプト数の上限
+IMAGE_BATCH_MAX_PROMPTS = int(os.getenv("IMAGE_BATCH_MAX_PROMPTS", "30"))
+# 一括レイアウト解析で1回のリクエストに詰める画像枚数 (1 なら従来どおり1枚ずつ)
+LAYOUT_BATCH_SIZE = int(os.getenv("LAYOUT_BATCH_SIZE", "4"))
+
+# --- 💾 Image Cache (model, prompt, options) -> PNG bytes ---
+image_cache = DiskCache(
+    "images",
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    max_age_seconds=int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600))),
+)
+
+# --- 💾 Layout Cache (image hash, model, prompt version) -> 解析結果 JSON ---
+layout_cache = DiskCache(
+    "layouts",
+    max_bytes=int(os.getenv("LAYOUT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_age_seconds=int(os.getenv("LAYOUT_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600))),
+)
+
 # --- 🧠 Brain Functions ---
 
-def generate_draft_concept(topic: str, slide_count: int = 5, is_locked: bool = False):
-    """ Page 1 -> 2: 構成案生成 """
-    print(f"📝 Draft Generation ({'LOCKED' if is_locked else 'CREATIVE'}) with {TEXT_MODEL_NAME}...")
-    model = genai.GenerativeModel(TEXT_MODEL_NAME)
-    
+def _build_draft_prompt(topic: str, slide_count: int, is_locked: bool):
+    """ 構成案生成プロンプト (LOCKED / CREATIVE) """
     if is_locked:
         prompt = f"""
         あなたは「文章フォーマッター」です。
@@ -84,44 +130,43 @@ def generate_draft_concept(topic: str, slide_count: int = 5, is_locked: bool = F
           ]
         }}
         """
+    return prompt
+
+def generate_draft_concept(topic: str, slide_count: int = 5, is_locked: bool = False):
+    """ Page 1 -> 2: 構成案生成 """
+    print(f"📝 Draft Generation ({'LOCKED' if is_locked else 'CREATIVE'}) with {TEXT_MODEL_NAME}...")
+    model = _genai().GenerativeModel(TEXT_MODEL_NAME, generation_config=DRAFT_GENERATION_CONFIG)
+    prompt = _build_draft_prompt(topic, slide_count, is_locked)
 
     try:
-        response = model.generate_content(prompt)
-        return _clean_and_parse_json(response.text)
+        response = _call_model(TEXT_MODEL_NAME, "gemini.draft", model.generate_content, prompt)
+        return _parse_draft_response(response.text)
     except Exception as e:
         print(f"Draft Error: {e}")
         return {"slides": []}
 
-def generate_image(prompt: str):
-    """ Page 2 -> 3: 画像生成 """
+def generate_image(prompt: str, generation_config: dict = None, use_cache: bool = True):
+    """
+    Page 2 -> 3: 画像生成
+    use_cache=False で強制的に新しい画像を生成 (結果はキャッシュを上書き)
+    """
+    cache_key = _image_cache_key(prompt, generation_config)
+    if use_cache:
+        cached = image_cache.get(cache_key)
+        if cached:
+            print(f"⚡ Image cache hit ({image_cache.hits} hits / {image_cache.misses} misses)")
+            return _to_base64(cached)
+
     try:
         print(f"🎨 Generating image with {IMAGE_MODEL_NAME}...")
-        model = genai.GenerativeModel(IMAGE_MODEL_NAME)
-        response = model.generate_content(prompt)
-        
-        if response.parts:
-            for part in response.parts:
-                if part.inline_data:
-                    return base64.b64encode(part.inline_data.data).decode('utf-8')
-        return None
+        model = _genai().GenerativeModel(IMAGE_MODEL_NAME)
+        response = _call_model(IMAGE_MODEL_NAME, "gemini.image", model.generate_content, prompt, generation_config=generation_config)
+        return _to_base64(_store_generated_image(cache_key, response))
     except Exception as e:
         print(f"Image Gen Error: {e}")
         return None
 
-def analyze_layout_from_image(image_base64: str):
-    return analyze_slide_for_remake(image_base64)
-
-def analyze_slide_for_remake(image_base64: str):
-    """
-    Export (Remake): 画像解析 & 要素分解 (Reverse Engineering)
-    ★修正: 「丸と四角で表現できないもの」を Type D (diagram_image) として検出するロジックを追加
-    """
-    try:
-        print(f"🔬 Full Remake Analysis (Decomposition) with {VISION_MODEL_NAME}...")
-        model = genai.GenerativeModel(VISION_MODEL_NAME)
-        image_part = {"mime_type": "image/png", "data": image_base64}
-        
-        prompt = """
+REMAKE_ANALYSIS_PROMPT = """
         あなたは「リバースエンジニアリング・デザイナー」です。
         提供されたスライド画像を解析し、それを**「Googleスライドで編集可能なデータ」**に変換するJSONを作成してください。
 
@@ -172,21 +217,420 @@ def analyze_slide_for_remake(image_base64: str):
           ]
         }
         """
+
+# 複数画像をまとめて送る場合の追加指示 (解析方針は REMAKE_ANALYSIS_PROMPT と共通)
+REMAKE_BATCH_INSTRUCTIONS = """
+        【複数画像の一括解析】
+        この後に {count} 枚のスライド画像が「画像 0」「画像 1」... のラベル付きで続きます。
+        各画像を上記の方針で**それぞれ独立に**解析し、画像ごとの結果を次の形式でまとめて出力してください。
+        画像を省略したり、複数の画像の要素を混ぜたりしないでください。
+
+        {{
+          "slides": [
+             {{ "image_index": 0, "background_color": "#FFFFFF", "elements": [ ... ] }},
+             {{ "image_index": 1, "background_color": "#FFFFFF", "elements": [ ... ] }}
+          ]
+        }}
+        """
+
+# プロンプトを変更したら自動的に別キャッシュになるよう本文のハッシュを使う
+REMAKE_PROMPT_VERSION = hashlib.sha256(REMAKE_ANALYSIS_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def analyze_layout_from_image(image_base64: str):
+    return analyze_slide_for_remake(image_base64)
+
+def analyze_slide_for_remake(image_base64: str):
+    """
+    Export (Remake): 画像解析 & 要素分解 (Reverse Engineering)
+    ★修正: 「丸と四角で表現できないもの」を Type D (diagram_image) として検出するロジックを追加
+    """
+    try:
+        image_bytes = base64.b64decode(image_base64)
+        cache_key = _layout_cache_key(image_bytes)
+        cached = _load_cached_layout(cache_key)
+        if cached is not None:
+            return cached
+
+        print(f"🔬 Full Remake Analysis (Decomposition) with {VISION_MODEL_NAME}...")
+        model = _genai().GenerativeModel(VISION_MODEL_NAME, generation_config=LAYOUT_GENERATION_CONFIG)
+        # 解析用に 540px 高へ縮小 & 再圧縮 (キャッシュキーは元画像のまま)
+        vision_bytes, vision_mime = prepare_for_vision(image_bytes)
+        image_part = {"mime_type": vision_mime, "data": vision_bytes}
         
-        response = model.generate_content([prompt, image_part])
-        data = _clean_and_parse_json(response.text)
-        
-        if "elements" not in data:
-            data["elements"] = []
-            
-        return data
+        response = _call_model(VISION_MODEL_NAME, "gemini.layout", model.generate_content, [REMAKE_ANALYSIS_PROMPT, image_part])
+        return _store_layout(cache_key, _parse_remake_response(response.text))
+
+    except Exception as e:
+        print(f"Full Remake Analysis Error: {e}")
+        return {"background_color": "#FFFFFF", "elements": []}
+
+# --- ⚡ Async Variants (イベントループをブロックしない) ---
+
+async def generate_draft_concept_async(topic: str, slide_count: int = 5, is_locked: bool = False):
+    """ generate_draft_concept の非同期版 (ネイティブ async クライアント使用) """
+    print(f"📝 Draft Generation Async ({'LOCKED' if is_locked else 'CREATIVE'}) with {TEXT_MODEL_NAME}...")
+    model = _genai().GenerativeModel(TEXT_MODEL_NAME, generation_config=DRAFT_GENERATION_CONFIG)
+    prompt = _build_draft_prompt(topic, slide_count, is_locked)
+
+    try:
+        response = await _call_model_async(TEXT_MODEL_NAME, "gemini.draft", lambda: model.generate_content_async(prompt))
+        return _parse_draft_response(response.text)
+    except Exception as e:
+        print(f"Draft Error: {e}")
+        return {"slides": []}
+
+async def stream_draft_concept(topic: str, slide_count: int = 5, is_locked: bool = False):
+    """
+    構成案をストリーミング生成し、slides 配列の要素が閉じるたびに slide dict を yield する
+    (LOCKED / CREATIVE 両対応)
+    各 slide は DraftSlide で検証してから返す。スキーマに合わない要素は捨てる
+    途中でモデル呼び出しが失敗した場合は例外をそのまま送出する (呼び出し側でエラー行を返す)
+    """
+    print(f"📝 Draft Streaming ({'LOCKED' if is_locked else 'CREATIVE'}) with {TEXT_MODEL_NAME}...")
+    model = _genai().GenerativeModel(TEXT_MODEL_NAME, generation_config=DRAFT_GENERATION_CONFIG)
+    prompt = _build_draft_prompt(topic, slide_count, is_locked)
+    parser = SlidesStreamParser()
+    full_text = []
+    emitted = 0
+
+    try:
+        response = await _call_model_async(TEXT_MODEL_NAME, "gemini.draft_stream_open", lambda: model.generate_content_async(prompt, stream=True))
+        async for chunk in response:
+            text = chunk.text
+            full_text.append(text)
+            for slide in parser.feed(text):
+                slide = _validate_draft_slide(slide)
+                if slide is not None:
+                    emitted += 1
+                    yield slide
+    except Exception as e:
+        print(f"Draft Stream Error: {e}")
+        raise
+
+    # 逐次パースで拾えなかった場合は全文を従来どおりパース
+    if emitted == 0 and full_text:
+        for slide in _parse_draft_response("".join(full_text)).get("slides", []):
+            slide = _validate_draft_slide(slide)
+            if slide is not None:
+                yield slide
+
+def _validate_draft_slide(slide):
+    try:
+        return DraftSlide.model_validate(slide).model_dump()
+    except ValidationError as e:
+        print(f"⚠️ Skipping invalid draft slide: {e.error_count()} error(s)")
+        return None
+
+async def generate_image_async(prompt: str, generation_config: dict = None, use_cache: bool = True):
+    """ generate_image の非同期版 """
+    return _to_base64(await generate_image_bytes_async(prompt, generation_config, use_cache))
+
+async def generate_image_bytes_async(prompt: str, generation_config: dict = None, use_cache: bool = True):
+    """ 画像生成 (PNG バイト列をそのまま返す / base64 変換なし) """
+    cache_key = _image_cache_key(prompt, generation_config)
+    if use_cache:
+        cached = await run_blocking(image_cache.get, cache_key)
+        if cached:
+            print(f"⚡ Image cache hit ({image_cache.hits} hits / {image_cache.misses} misses)")
+            return cached
+
+    try:
+        print(f"🎨 Generating image (async) with {IMAGE_MODEL_NAME}...")
+        model = _genai().GenerativeModel(IMAGE_MODEL_NAME)
+        response = await _call_model_async(IMAGE_MODEL_NAME, "gemini.image",
+            lambda: model.generate_content_async(prompt, generation_config=generation_config)
+        )
+        return await run_blocking(_store_generated_image, cache_key, response)
+    except Exception as e:
+        print(f"Image Gen Error: {e}")
+        return None
+
+async def generate_images_as_completed(prompts: list, max_concurrency: int = IMAGE_BATCH_CONCURRENCY, use_cache: bool = True):
+    """
+    複数プロンプトを並列に生成し、完了した順に (index, image_base64) を yield する
+    失敗したものは image_base64 = None
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _generate(i, prompt):
+        async with semaphore:
+            return i, await generate_image_async(prompt, use_cache=use_cache)
+
+    tasks = [asyncio.ensure_future(_generate(i, p)) for i, p in enumerate(prompts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # クライアント切断時などは残りをキャンセル
+        for task in tasks:
+            task.cancel()
+
+async def analyze_slide_for_remake_async(image_base64: str):
+    """ analyze_slide_for_remake の非同期版 """
+    try:
+        image_bytes = base64.b64decode(image_base64)
+    except Exception as e:
+        print(f"Full Remake Analysis Error: {e}")
+        return {"background_color": "#FFFFFF", "elements": []}
+    return await analyze_slide_bytes_for_remake_async(image_bytes)
+
+async def analyze_slide_bytes_for_remake_async(image_bytes: bytes, mime_type: str = "image/png"):
+    """ 画像バイト列を直接受け取る版 (multipart アップロード用) """
+    cache_key = _layout_cache_key(image_bytes)
+    cached = await run_blocking(_load_cached_layout, cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        print(f"🔬 Full Remake Analysis (async) with {VISION_MODEL_NAME}...")
+        model = _genai().GenerativeModel(VISION_MODEL_NAME, generation_config=LAYOUT_GENERATION_CONFIG)
+        vision_bytes, vision_mime = await prepare_for_vision_async(image_bytes, mime_type)
+        image_part = {"mime_type": vision_mime, "data": vision_bytes}
+        response = await _call_model_async(VISION_MODEL_NAME, "gemini.layout",
+            lambda: model.generate_content_async([REMAKE_ANALYSIS_PROMPT, image_part])
+        )
+        return await run_blocking(_store_layout, cache_key, _parse_remake_response(response.text))
 
     except Exception as e:
         print(f"Full Remake Analysis Error: {e}")
         return {"background_color": "#FFFFFF", "elements": []}
 
+async def analyze_slides_for_remake_batch_async(images_base64: list, batch_size: int = None):
+    """
+    複数スライドの一括解析: batch_size 枚ずつ1回の vision リクエストにまとめ、
+    長い解析プロンプトと1回あたりのレイテンシをデッキ全体で共有する
+    戻り値は入力と同じ順序のレイアウトのリスト (解析できなかった画像は空の elements)
+    """
+    images = []
+    for image_base64 in images_base64:
+        try:
+            images.append((base64.b64decode(image_base64), "image/png"))
+        except Exception as e:
+            print(f"Full Remake Analysis Error: {e}")
+            images.append(None)
+    return await analyze_slide_bytes_batch_for_remake_async(images, batch_size)
+
+async def analyze_slide_bytes_batch_for_remake_async(images: list, batch_size: int = None):
+    """
+    images: [(image_bytes, mime_type) or None]
+    - キャッシュ済みの画像はモデルに送らない
+    - バッチの応答に欠けている画像 (パース失敗 / image_index 不足) は1枚ずつの解析にフォールバック
+    """
+    batch_size = max(1, batch_size or LAYOUT_BATCH_SIZE)
+    empty = {"background_color": "#FFFFFF", "elements": []}
+    results = [dict(empty) if image is None else None for image in images]
+
+    keys = {}
+    for i, image in enumerate(images):
+        if image is None:
+            continue
+        keys[i] = _layout_cache_key(image[0])
+        cached = await run_blocking(_load_cached_layout, keys[i])
+        if cached is not None:
+            results[i] = cached
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    async def _analyze_batch(indices):
+        if len(indices) == 1:
+            layouts = {}
+        else:
+            layouts = await _analyze_layout_batch([images[i] for i in indices])
+        async def _one(position, i):
+            layout = layouts.get(position)
+            if layout is None:
+                if len(indices) > 1:
+                    print(f"🔂 Slide image {i}: missing from batch response. Analyzing individually...")
+                results[i] = await analyze_slide_bytes_for_remake_async(*images[i])
+            else:
+                results[i] = await run_blocking(_store_layout, keys[i], layout)
+
+        # 個別解析へのフォールバックも並列に (同時実行数はレートリミッターが抑える)
+        await asyncio.gather(*[_one(position, i) for position, i in enumerate(indices)])
+
+    batches = [pending[k:k + batch_size] for k in range(0, len(pending), batch_size)]
+    await asyncio.gather(*[_analyze_batch(indices) for indices in batches])
+    return results
+
+async def _analyze_layout_batch(images: list):
+    """ 複数画像を1回のリクエストで解析し、{バッチ内の位置: レイアウト} を返す (失敗時は空) """
+    try:
+        print(f"🔬 Batched Remake Analysis ({len(images)} images) with {VISION_MODEL_NAME}...")
+        model = _genai().GenerativeModel(VISION_MODEL_NAME, generation_config=LAYOUT_BATCH_GENERATION_CONFIG)
+        prepared = await asyncio.gather(*[prepare_for_vision_async(data, mime) for data, mime in images])
+        contents = [REMAKE_ANALYSIS_PROMPT, REMAKE_BATCH_INSTRUCTIONS.format(count=len(images))]
+        for position, (vision_bytes, vision_mime) in enumerate(prepared):
+            contents += [f"画像 {position}:", {"mime_type": vision_mime, "data": vision_bytes}]
+        response = await _call_model_async(VISION_MODEL_NAME, "gemini.layout_batch",
+            lambda: model.generate_content_async(contents)
+        )
+        return _parse_remake_batch_response(response.text, len(images))
+    except Exception as e:
+        print(f"Batched Remake Analysis Error: {e}")
+        return {}
+
 # --- 🛠️ Helpers ---
 
+def _call_model(model_name: str, stage: str, func, *args, **kwargs):
+    """ レート制限 + リトライ + レイテンシ計測つきのモデル呼び出し """
+    with span(stage, model_name):
+        return get_limiter(model_name).call(func, *args, **kwargs)
+
+async def _call_model_async(model_name: str, stage: str, coro_factory):
+    with span(stage, model_name):
+        return await get_limiter(model_name).call_async(coro_factory)
+
+def _extract_image_bytes(response):
+    """ レスポンスから最初の画像パートのバイト列を取り出す """
+    if response.parts:
+        for part in response.parts:
+            if part.inline_data:
+                return part.inline_data.data
+    return None
+
+def normalize_prompt(prompt: str):
+    return " ".join((prompt or "").split())
+
+def _image_cache_key(prompt: str, generation_config: dict = None):
+    return make_key(IMAGE_MODEL_NAME, normalize_prompt(prompt), generation_config or {})
+
+def _to_base64(image_bytes):
+    return base64.b64encode(image_bytes).decode('utf-8') if image_bytes else None
+
+def _store_generated_image(cache_key, response):
+    image_bytes = _extract_image_bytes(response)
+    if not image_bytes:
+        return None
+    try:
+        image_cache.put(cache_key, image_bytes)
+    except OSError as e:
+        print(f"Image Cache Write Error: {e}")
+    return image_bytes
+
+def _layout_cache_key(image_bytes: bytes):
+    """ 画像バイトのハッシュ + モデル + プロンプトのバージョン (本文ハッシュ) """
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    return make_key(VISION_MODEL_NAME, REMAKE_PROMPT_VERSION, image_digest)
+
+def _load_cached_layout(cache_key):
+    cached = layout_cache.get(cache_key)
+    if not cached:
+        return None
+    print(f"⚡ Layout cache hit ({layout_cache.hits} hits / {layout_cache.misses} misses)")
+    return orjson.loads(cached)
+
+def _store_layout(cache_key, data):
+    # 解析失敗 (空の結果) はキャッシュしない
+    if data.get("elements") or data.get("background_color"):
+        try:
+            layout_cache.put(cache_key, orjson.dumps(data))
+        except OSError as e:
+            print(f"Layout Cache Write Error: {e}")
+    return data
+
+def _parse_draft_response(text):
+    """ スキーマで検証 → 失敗時のみ従来の寛容なパースにフォールバック """
+    try:
+        return DraftResponse.model_validate_json(text).model_dump()
+    except ValidationError:
+        return _clean_and_parse_json(text)
+
+def _parse_remake_response(text):
+    try:
+        return LayoutResponse.model_validate_json(text).model_dump(exclude_none=True)
+    except ValidationError:
+        data = _clean_and_parse_json(text)
+    if "elements" not in data:
+        data["elements"] = []
+    return data
+
+def _parse_remake_batch_response(text, count):
+    """ image_index ごとに分解。範囲外・重複・要素の無い結果は捨てる (→ 1枚ずつ再解析) """
+    try:
+        slides = BatchLayoutResponse.model_validate_json(text).model_dump(exclude_none=True)["slides"]
+    except ValidationError:
+        data = _clean_and_parse_json(text)
+        slides = (data.get("slides") if isinstance(data, dict) else None) or []
+    slides = [item for item in slides if isinstance(item, dict)]
+    # 1始まりで番号を振ってくることがあるので揃える
+    # (count が含まれていて 0 が無い場合のみ。0始まりで一部が抜けただけの応答をずらさないため)
+    indices = [item.get("image_index") for item in slides]
+    shift = 1 if count in indices and 0 not in indices and all(isinstance(i, int) and 1 <= i <= count for i in indices) else 0
+    layouts = {}
+    for item in slides:
+        index = item.pop("image_index", None)
+        if isinstance(index, int):
+            index -= shift
+        if not isinstance(index, int) or not 0 <= index < count or index in layouts:
+            continue
+        if not item.get("elements"):
+            continue
+        layouts[index] = item
+    return layouts
+
+class SlidesStreamParser:
+    """
+    ストリームで届く JSON テキストから "slides" 配列の要素を逐次取り出すパーサー
+    文字列リテラル / エスケープを考慮しつつ波括弧の深さだけを追跡する
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+        self.done = False
+
+    def feed(self, text: str):
+        self.buffer += text
+        slides = []
+        if not self.in_array and not self._find_array_start():
+            return slides
+
+        buf = self.buffer
+        i = self.pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                if self.depth == 0:
+                    self.obj_start = i
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.obj_start is not None:
+                    try:
+                        slides.append(orjson.loads(buf[self.obj_start:i + 1]))
+                    except orjson.JSONDecodeError:
+                        pass
+                    self.obj_start = None
+            elif c == "]" and self.depth == 0:
+                self.done = True
+            i += 1
+        self.pos = i
+        return slides
+
+    def _find_array_start(self):
+        key = self.buffer.find('"slides"')
+        if key == -1:
+            return False
+        bracket = self.buffer.find("[", key)
+        if bracket == -1:
+            return False
+        self.in_array = True
+        self.pos = bracket + 1
+        return True
+
 def _clean_and_parse_json(text):
     try:
         text = re.sub(r'```json\s*', '', text)
@@ -194,6 +638,6 @@ def _clean_and_parse_json(text):
         text = text.strip()
         start = text.find('{')
         end = text.rfind('}') + 1
-        return json.loads(text[start:end]) if start != -1 else json.loads(text)
+        return orjson.loads(text[start:end]) if start != -1 else orjson.loads(text)
     except:
         return {}
\ No newline at end of file
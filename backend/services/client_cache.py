@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- ⚙️ Settings ---
+# アクセストークンの有効期限 (通常1時間) より少し短めに
+CLIENT_TTL_SECONDS = int(os.getenv("GOOGLE_CLIENT_TTL_SECONDS", "3000"))
+CLIENT_CACHE_MAX_ENTRIES = int(os.getenv("GOOGLE_CLIENT_CACHE_MAX_ENTRIES", "256"))
+HTTP_TIMEOUT_SECONDS = int(os.getenv("GOOGLE_HTTP_TIMEOUT_SECONDS", "120"))
+
+# --- 📄 Discovery Document (プロセスごとに1回だけ読み込む) ---
+# googleapiclient に同梱の静的ドキュメントを使う (ネットワーク取得なし)。
+# discovery スタックは import が重いので実際に使う時まで読み込まない
+
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+def get_discovery_doc(api: str, version: str):
+    key = (api, version)
+    doc = _discovery_docs.get(key)
+    if doc is not None:
+        return doc
+    with _discovery_lock:
+        if key not in _discovery_docs:
+            from googleapiclient.discovery_cache import get_static_doc
+            raw = get_static_doc(api, version)
+            _discovery_docs[key] = json.loads(raw) if raw else None
+        return _discovery_docs[key]
+
+# --- 🔌 Service Client Cache ---
+
+class ServiceClientCache:
+    """
+    (トークン, API) ごとに構築済みの Resource を保持し、全スレッドで共有する
+    - httplib2.Http はスレッドセーフではないため、HTTP 接続だけ _ThreadLocalHttp でスレッドごとに持つ
+      (新しいスレッドでも Resource の構築は不要で、接続を1本張るだけ)
+    - TTL 切れ・上限超過・無効化されたエントリは辞書から外すだけ。スレッドごとの接続は
+      エントリが参照されなくなるか、スレッドが終了した時点で threading.local ごと解放される
+    """
+
+    def __init__(self, ttl=CLIENT_TTL_SECONDS, max_entries=CLIENT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, api: str, version: str, creds):
+        key = (_token_key(creds.token), api, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        service = _build_service(api, version, creds)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                # 他のスレッドが先に構築していればそちらを使う
+                return entry[0]
+            self._entries[key] = (service, now)
+            self._entries.move_to_end(key)
+            self._evict(now)
+        return service
+
+    def invalidate_token(self, token: str):
+        """ 401 などでトークンが使えなくなった時に、そのトークンのクライアントを捨てる """
+        token_key = _token_key(token)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == token_key]:
+                del self._entries[key]
+
+    def _evict(self, now):
+        for key in [k for k, (_, created) in self._entries.items() if now - created >= self.ttl]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class _ThreadLocalHttp:
+    """
+    AuthorizedHttp をスレッドごとに作って委譲する http (googleapiclient の Resource に渡す)
+    close() は呼び出したスレッドの接続だけを閉じる (他スレッドで使用中の接続には触れない)
+    """
+
+    def __init__(self, creds):
+        self.credentials = creds
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import httplib2
+            import google_auth_httplib2
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+            self._local.http = http
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def close(self):
+        http = getattr(self._local, "http", None)
+        if http is not None:
+            self._local.http = None
+            http.close()
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+def _token_key(token: str):
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+def warm_up(apis=(('drive', 'v3'), ('slides', 'v1'))):
+    """
+    ウォームアップ: discovery スタックの import / 静的ドキュメントのパース / Resource 構築を先に済ませる
+    (構築した Resource は認証なしなので捨てる。トークンごとの接続は初回リクエスト時に張る)
+    """
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    for api, version in apis:
+        doc = get_discovery_doc(api, version)
+        if doc is not None:
+            build_from_document(doc, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS)).close()
+
+def _build_service(api: str, version: str, creds):
+    from googleapiclient.discovery import build, build_from_document
+
+    http = _ThreadLocalHttp(creds)
+    doc = get_discovery_doc(api, version)
+    if doc is None:
+        logger.warning(f"⚠️ No static discovery doc for {api} {version}. Building from network...")
+        return build(api, version, http=http)
+    return build_from_document(doc, http=http)
+
+
+service_clients = ServiceClientCache()
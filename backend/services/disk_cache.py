@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from services.metrics import record_cache_lookup
+
+# --- 💾 ローカルキャッシュの保存先 ---
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache"))
+
+
+def make_key(*parts):
+    """ 任意のパーツ (dict 含む) から安定したキャッシュキーを作る """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    バイト列用のシンプルなディスクキャッシュ
+    - 1エントリ = 1ファイル (書き込みは一時ファイル + rename でアトミック)
+    - 最終アクセス時刻 (mtime) で期限切れ判定 & 古い順に容量超過分を削除
+    """
+
+    def __init__(self, name: str, max_bytes: int, max_age_seconds: int, root: str = CACHE_DIR):
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str):
+        return os.path.join(self.dir, key)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            record_cache_lookup(self.name, False)
+            return None
+        with self._lock:
+            self.hits += 1
+        record_cache_lookup(self.name, True)
+        return data
+
+    def put(self, key: str, data: bytes):
+        os.makedirs(self.dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """ 期限切れ → 容量超過 (古い順) の順で削除 """
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.dir) if os.path.isdir(self.dir) else []:
+                if not entry.is_file() or entry.name.startswith(".tmp-"):
+                    continue
+                st = entry.stat()
+                if now - st.st_mtime > self.max_age_seconds:
+                    os.remove(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
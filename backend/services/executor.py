@@ -0,0 +1,29 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# --- ⚙️ Blocking I/O 用の共有スレッドプール ---
+# googleapiclient には async クライアントが無いため、上限付きプールで実行する
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+
+_executor = None
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+    return _executor
+
+async def run_blocking(func, *args, **kwargs):
+    """ 同期関数をスレッドプールで実行し、イベントループを止めずに結果を待つ (contextvars も引き継ぐ) """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(ctx.run, func, *args, **kwargs))
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
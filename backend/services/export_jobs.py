@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services import google_service
+from services.disk_cache import CACHE_DIR
+from services.metrics import correlation_id, span
+
+logger = logging.getLogger(__name__)
+
+# --- ⚙️ Settings ---
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "4"))
+EXPORT_JOBS_PER_USER = int(os.getenv("EXPORT_JOBS_PER_USER", "2"))
+EXPORT_JOB_DIR = os.getenv("EXPORT_JOB_DIR", os.path.join(CACHE_DIR, "export_jobs"))
+MAX_EVENTS_PER_JOB = 200
+# 実行中でないジョブ (完了 / 失敗 / 中断) を残しておく秒数 (最終更新からこれを過ぎたらメモリとファイルから消す)
+EXPORT_JOB_RETENTION_SECONDS = int(os.getenv("EXPORT_JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+ACTIVE_STATUSES = ("queued", "running")
+# 投入時の内容 (base64 の背景画像を含む) は別ファイルに1回だけ書き、進捗の保存では書き直さない
+PAYLOAD_FIELDS = ("slides",)
+PAYLOAD_SUFFIX = ".payload.json"
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class ExportJobManager:
+    """
+    エクスポートをバックグラウンドで実行するジョブ管理
+    - 状態はジョブごとの JSON ファイルに保存 (トークンは保存しない)
+      スライド本体 ({id}.payload.json) と進捗 ({id}.json) は分けて保存し、進捗イベントでは進捗側だけ書き直す
+    - 再起動で中断されたジョブは "interrupted" になり、トークンを再送すれば描画済みスライドを飛ばして再開できる
+    - 完了 / 失敗 / 中断したジョブは retention_seconds を過ぎたら削除する (起動時と投入時に掃除)
+      中断したジョブもこの期間内に再開されなければ消える
+    """
+
+    def __init__(self, job_dir=EXPORT_JOB_DIR, workers=EXPORT_JOB_WORKERS, per_user_limit=EXPORT_JOBS_PER_USER,
+                 retention_seconds=EXPORT_JOB_RETENTION_SECONDS):
+        self.job_dir = job_dir
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._write_locks = {}  # job_id -> Lock (同じジョブのファイル書き込みを順序どおりに)
+        self._pool = None
+
+    # --- Public API ---
+
+    def start(self):
+        """ 起動時: 保存済みジョブを読み込み、実行中だったものを interrupted にする """
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export-job")
+        for name in os.listdir(self.job_dir):
+            if not name.endswith(".json") or name.endswith(PAYLOAD_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Broken job file {name}: {e}")
+                continue
+            if "slides" not in job:
+                try:
+                    with open(self._payload_path(job["id"]), encoding="utf-8") as f:
+                        job.update(json.load(f))
+                except (OSError, ValueError) as e:
+                    # 状態・結果は読めるので残す (再開はできない / 保持期限で消える)
+                    logger.error(f"❌ Broken job payload {job['id']}: {e}")
+                    job["slides"] = []
+            if job.get("status") in ACTIVE_STATUSES:
+                job["status"] = "interrupted"
+                self._add_event(job, {"stage": "interrupted"})
+                self._save(job)
+            self._jobs[job["id"]] = job
+        with self._lock:
+            self._purge_expired()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def submit(self, token: str, title: str, slides: list, presentation_id: str = None):
+        owner = _owner_key(google_service.get_user_id(token))
+        with self._lock:
+            self._purge_expired()
+            self._check_limit(owner)
+            job = {
+                "id": uuid.uuid4().hex,
+                "owner": owner,
+                "title": title,
+                "status": "queued",
+                "created_at": time.time(),
+                "updated_at": time.time(),
+                "total": len(slides),
+                "slides": slides,
+                "presentation_id": presentation_id,
+                "uploaded": False,
+                "render_state": {},
+                "events": [],
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            state = self._state_json(job)
+        self._save_payload(job)
+        self._write_state(job["id"], state)
+        self._pool.submit(self._run, job["id"], token)
+        return job["id"]
+
+    def resume(self, job_id: str, token: str):
+        owner = _owner_key(google_service.get_user_id(token))
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job["owner"] != owner:
+                raise PermissionError(job_id)
+            if job["status"] not in ("interrupted", "failed"):
+                return job["id"]
+            self._check_limit(owner)
+            job["status"] = "queued"
+            job["error"] = None
+            self._add_event(job, {"stage": "resumed"})
+            state = self._state_json(job)
+        self._write_state(job_id, state)
+        self._pool.submit(self._run, job_id, token)
+        return job_id
+
+    def get(self, job_id: str, token: str):
+        """ 他のユーザーのジョブは存在しないものとして None を返す """
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != _owner_key(google_service.get_user_id(token)):
+            return None
+        return job
+
+    def status(self, job_id: str, token: str):
+        job = self.get(job_id, token)
+        if job is None:
+            return None
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "title": job["title"],
+            "total": job["total"],
+            "rendered": len(job["render_state"].get("rendered", [])),
+            "events": job["events"][-20:],
+            "error": job["error"],
+        }
+
+    # --- Worker ---
+
+    def _run(self, job_id: str, token: str):
+        correlation_id.set(job_id[:16])
+        job = self._jobs[job_id]
+        self._update(job, status="running")
+        try:
+            with span("export", "job"):
+                self._export(job, token)
+        except Exception as e:
+            logger.error(f"💀 Export job {job_id} failed: {e}")
+            self._update(job, status="failed", error=str(e), event={"stage": "failed"})
+
+    def _export(self, job, token: str):
+        plan = None
+        if not job["uploaded"]:
+            slides, only = job["slides"], None
+            if job.get("presentation_id"):
+                # 差分更新: 先に差分を取り、追加 / 変更されたスライドの背景だけをアップロードする
+                slides = google_service.with_background_hashes(slides)
+                plan = google_service.plan_presentation_update(token, job["presentation_id"], slides)
+                only = set(plan["changed"])
+            folder_id = google_service.get_or_create_project_folder(token)
+            slides = asyncio.run(google_service.upload_slide_backgrounds_async(token, folder_id, slides, only=only))
+            # アップロード済みの base64 は保持しない (再開時は drive_url を使う)
+            for slide in slides:
+                slide.pop("backgroundImage", None)
+            self._update(job, slides=slides, uploaded=True, event={"stage": "uploaded"})
+
+        def _progress(event):
+            self._update(job, event=event)
+
+        changes = None
+        if job.get("presentation_id"):
+            # 差分更新は再実行しても指紋の比較からやり直すだけなので render_state は使わない
+            pres_id, changes = google_service.update_presentation_from_drive_images(
+                token, job["presentation_id"], job["slides"], progress=_progress, plan=plan
+            )
+        else:
+            pres_id = google_service.create_presentation_from_drive_images(
+                token, job["title"], job["slides"], progress=_progress, state=job["render_state"]
+            )
+        url = f"https://docs.google.com/presentation/d/{pres_id}/edit"
+        result = {"url": url, "presentation_id": pres_id}
+        if changes is not None:
+            result["changes"] = changes
+        self._update(job, status="succeeded", result=result, event={"stage": "done"})
+
+    # --- Helpers ---
+
+    def _check_limit(self, owner):
+        active = sum(1 for j in self._jobs.values() if j["owner"] == owner and j["status"] in ACTIVE_STATUSES)
+        if active >= self.per_user_limit:
+            raise JobLimitExceeded(owner)
+
+    def _purge_expired(self):
+        """ 保持期限を過ぎた実行中でないジョブを消す (self._lock を持った状態で呼ぶ) """
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.get("status") not in ACTIVE_STATUSES and job.get("updated_at", 0) < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._write_locks.pop(job_id, None)
+            for path in (self._state_path(job_id), self._payload_path(job_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"⚠️ Could not remove expired job file {path}: {e}")
+        if expired:
+            logger.info(f"🧹 Removed {len(expired)} expired export job(s)")
+
+    def _update(self, job, event=None, **fields):
+        """ メモリ上の更新だけストア全体のロック内で行い、ファイル書き込みはジョブ単位のロックで """
+        with self._write_lock(job["id"]):
+            with self._lock:
+                job.update(fields)
+                if event:
+                    self._add_event(job, event)
+                state = self._state_json(job)
+            if any(field in fields for field in PAYLOAD_FIELDS):
+                self._save_payload(job)
+            self._write_state(job["id"], state)
+
+    def _write_lock(self, job_id):
+        with self._lock:
+            return self._write_locks.setdefault(job_id, threading.Lock())
+
+    @staticmethod
+    def _add_event(job, event):
+        job["events"].append(dict(event, at=time.time()))
+        del job["events"][:-MAX_EVENTS_PER_JOB]
+        job["updated_at"] = time.time()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _payload_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}{PAYLOAD_SUFFIX}")
+
+    @staticmethod
+    def _state_json(job):
+        return json.dumps({k: v for k, v in job.items() if k not in PAYLOAD_FIELDS}, ensure_ascii=False)
+
+    def _save(self, job):
+        self._write_state(job["id"], self._state_json(job))
+
+    def _save_payload(self, job):
+        self._write_file(self._payload_path(job["id"]), json.dumps({k: job[k] for k in PAYLOAD_FIELDS}, ensure_ascii=False))
+
+    def _write_state(self, job_id, state):
+        self._write_file(self._state_path(job_id), state)
+
+    def _write_file(self, path, text):
+        os.makedirs(self.job_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def _owner_key(user_id: str):
+    return hashlib.sha256((user_id or "").encode("utf-8")).hexdigest()
+
+
+export_jobs = ExportJobManager()
@@ -1,30 +1,80 @@
+import asyncio
 import base64
+import contextvars
+import hashlib
 import io
+import os
 import time
 import json
 import logging
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
 from googleapiclient.errors import HttpError
-from google.oauth2.credentials import Credentials
 
 # ★画像生成関数をインポート
-from services.ai_service import generate_image
+from services.ai_service import generate_image, normalize_prompt
+from services.executor import get_executor, run_blocking
+from services.client_cache import service_clients
+from services.disk_cache import make_key
+from services.image_pipeline import prepare_for_background_async, extension_for
+from services.metrics import span, record_fallback
+from services.rate_limit import get_limiter
+from services.remake_optimizer import optimize_elements, needs_paragraph_style
+from services.request_preflight import preflight_requests
+from services.upload_index import upload_index, content_hash, stream_hash
 
 # --- 📝 ログ設定 ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 同時アップロード数の上限 (エクスポート時)
+UPLOAD_CONCURRENCY = int(os.getenv("DRIVE_UPLOAD_CONCURRENCY", "8"))
+# diagram_image 再生成 (生成 + アップロード) の同時実行数
+DIAGRAM_CONCURRENCY = int(os.getenv("DIAGRAM_CONCURRENCY", "4"))
+# 1回の batchUpdate に詰めるリクエスト数の目安
+MAX_REQUESTS_PER_BATCH = int(os.getenv("SLIDES_MAX_REQUESTS_PER_BATCH", "500"))
+# プロジェクトフォルダIDのキャッシュ有効期間
+FOLDER_CACHE_TTL_SECONDS = int(os.getenv("FOLDER_CACHE_TTL_SECONDS", "21600"))
+TOKEN_USER_TTL_SECONDS = 3600
+# このサイズを超える画像のみ resumable (チャンク) アップロード。それ以下は multipart 1往復
+RESUMABLE_UPLOAD_THRESHOLD = int(os.getenv("DRIVE_RESUMABLE_THRESHOLD_BYTES", str(5 * 1024 * 1024)))
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+# 公開権限の付与方法: batch (バッチHTTPでまとめて付与) / folder (フォルダを1回だけ公開) / per_file
+DRIVE_PERMISSION_MODE = os.getenv("DRIVE_PERMISSION_MODE", "batch")
+PERMISSION_BATCH_SIZE = 100  # Drive バッチリクエストの上限
+PUBLIC_READER = {'type': 'anyone', 'role': 'reader'}
+# 差分エクスポート用: 生成したページの objectId は gen_<指紋の先頭>_<index>_<revision>
+# 指紋の無い gen_slide_<index>_<revision> は描画に失敗したページ (次回の差分エクスポートで作り直す)
+PAGE_FINGERPRINT_LENGTH = 16
+GENERATED_PAGE_ID = re.compile(r'^gen_(?:slide|([0-9a-f]{%d}))_\d+_\d+$' % PAGE_FINGERPRINT_LENGTH)
+
 # --- Helper Functions ---
 
 def _get_creds(token: str):
+    from google.oauth2.credentials import Credentials  # google.auth は import が重いので遅延読み込み
     return Credentials(token=token)
 
 def _get_drive_service(creds):
-    return build('drive', 'v3', credentials=creds)
+    return service_clients.get('drive', 'v3', creds)
 
 def _get_slides_service(creds):
-    return build('slides', 'v1', credentials=creds)
+    return service_clients.get('slides', 'v1', creds)
+
+def _execute(api: str, request, stage: str = None):
+    """ API ごとのレート制限 + リトライ (429 / 5xx) 付きで request.execute() する (stage 指定時は計測) """
+    try:
+        if stage is None:
+            return get_limiter(api).call(request.execute)
+        with span(stage, api):
+            return get_limiter(api).call(request.execute)
+    except HttpError as e:
+        if getattr(e.resp, 'status', None) == 401:
+            # 期限切れ / 取り消されたトークンのクライアントはキャッシュから外す
+            credentials = getattr(getattr(request, 'http', None), 'credentials', None)
+            if credentials is not None:
+                service_clients.invalidate_token(credentials.token)
+        raise
 
 def _safe_hex_to_rgb(hex_color):
     """ 安全な色変換 """
@@ -49,124 +99,712 @@ def _safe_hex_to_rgb(hex_color):
 
 # --- Drive Operations ---
 
-def upload_image_to_drive(token: str, folder_id: str, image_base64: str, filename: str):
+class FolderIdCache:
+    """
+    ユーザー (Drive permissionId) ごとのプロジェクトフォルダIDキャッシュ
+    - トークン → ユーザーの対応も保持し、同一トークンでは about() を再度呼ばない
+    - ユーザー単位のロックで、同時エクスポートによるフォルダ重複作成を防ぐ
+    """
+
+    def __init__(self, ttl=FOLDER_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._folders = {}   # (user_id, folder_name) -> (folder_id, cached_at)
+        self._users = {}     # token -> (user_id, cached_at) ※トークン寿命(1h)に合わせて破棄
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def user_lock(self, user_id):
+        with self._lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def get_user(self, token):
+        entry = self._users.get(token)
+        if entry and time.monotonic() - entry[1] < TOKEN_USER_TTL_SECONDS:
+            return entry[0]
+        return None
+
+    def set_user(self, token, user_id):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (_, at) in self._users.items() if now - at >= TOKEN_USER_TTL_SECONDS]:
+                del self._users[key]
+            self._users[token] = (user_id, now)
+
+    def get(self, user_id, folder_name):
+        entry = self._folders.get((user_id, folder_name))
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def set(self, user_id, folder_name, folder_id):
+        with self._lock:
+            self._folders[(user_id, folder_name)] = (folder_id, time.monotonic())
+
+    def invalidate_folder(self, folder_id):
+        with self._lock:
+            for key in [k for k, (fid, _) in self._folders.items() if fid == folder_id]:
+                del self._folders[key]
+
+
+folder_cache = FolderIdCache()
+
+def get_user_id(token: str):
+    """ トークンから Drive ユーザー (permissionId) を解決する (キャッシュ付き) """
+    return _get_user_id(token, _get_drive_service(_get_creds(token)))
+
+def _get_user_id(token: str, service):
+    user_id = folder_cache.get_user(token)
+    if user_id is None:
+        about = _execute('drive', service.about().get(fields='user(permissionId)'), 'drive.about')
+        # permissionId が取れない場合もトークンそのものは ID にしない (アップロードインデックスに保存されるため)
+        user_id = about.get('user', {}).get('permissionId') or 'token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+        folder_cache.set_user(token, user_id)
+    return user_id
+
+def _is_not_found(error):
+    return isinstance(error, HttpError) and getattr(error.resp, 'status', None) == 404
+
+def upload_image_to_drive(token: str, folder_id: str, image_base64: str, filename: str, grant_public: bool = True):
+    try:
+        image_data = base64.b64decode(image_base64)
+    except Exception as e:
+        logger.error(f"❌ Upload Error: {e}")
+        return None
+    return upload_image_stream_to_drive(token, folder_id, io.BytesIO(image_data), filename, grant_public=grant_public)
+
+def upload_image_stream_to_drive(token: str, folder_id: str, stream, filename: str, mimetype: str = 'image/png', grant_public: bool = True):
+    """
+    ファイルライクオブジェクト (BytesIO / SpooledTemporaryFile 等) をそのまま Drive へ送る
+    バイト列を丸ごとコピーせず、ハッシュ計算も送信もストリームから読む
+    grant_public=False の場合は公開権限の付与を呼び出し側 (grant_public_read でまとめて) に任せ、
+    戻り値に pending_grant=True を付ける
+    """
     creds = _get_creds(token)
     service = _get_drive_service(creds)
     try:
-        image_data = base64.b64decode(image_base64)
-        file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaIoBaseUpload(io.BytesIO(image_data), mimetype='image/png', resumable=True)
-        
-        file = service.files().create(
-            body=file_metadata, 
-            media_body=media, 
-            fields='id, thumbnailLink, webContentLink'
-        ).execute()
+        # ★ 同じバイト列をアップロード済みなら再利用
+        user_id = _get_user_id(token, service)
+        digest = stream_hash(stream)
+        cached_file_id = upload_index.get(user_id, digest)
+        if cached_file_id:
+            reused = _refresh_uploaded_file(service, cached_file_id)
+            if reused:
+                logger.info(f"♻️ Reusing uploaded image for {filename} ({cached_file_id})")
+                return dict(reused, digest=digest)
+
+        try:
+            file = _create_drive_file(service, folder_id, stream, filename, mimetype)
+        except HttpError as e:
+            if not _is_not_found(e):
+                raise
+            # キャッシュ済みフォルダが削除されていた → 再検索してリトライ
+            logger.info(f"📁 Folder {folder_id} missing. Re-resolving project folder...")
+            folder_cache.invalidate_folder(folder_id)
+            folder_id = get_or_create_project_folder(token)
+            file = _create_drive_file(service, folder_id, stream, filename, mimetype)
         
         file_id = file.get('id')
-        service.permissions().create(fileId=file_id, body={'type': 'anyone', 'role': 'reader'}).execute()
+        pending_grant = DRIVE_PERMISSION_MODE != 'folder'
+        if pending_grant and (grant_public or DRIVE_PERMISSION_MODE == 'per_file'):
+            _execute('drive', service.permissions().create(fileId=file_id, body=PUBLIC_READER), 'drive.permission')
+            pending_grant = False
         
-        thumbnail_link = file.get('thumbnailLink')
-        image_url = thumbnail_link.replace('=s220', '=s3000') if thumbnail_link else file.get('webContentLink')
-            
-        return {"file_id": file_id, "url": image_url}
+        image_url = _image_url(file)
+        if image_url and not pending_grant:
+            # 公開権限の付与を後回しにした場合は、付与が成功した時点で grant_public_read が登録する
+            upload_index.put(user_id, digest, file_id)
+
+        result = {"file_id": file_id, "url": image_url, "digest": digest}
+        if pending_grant:
+            result["pending_grant"] = True
+        return result
     except Exception as e:
         logger.error(f"❌ Upload Error: {e}")
         return None
 
+def _refresh_uploaded_file(service, file_id):
+    """
+    インデックスにあるファイルの最新のリンクを取得する (thumbnailLink は短時間で失効するため毎回取り直す)
+    削除済み / ゴミ箱のファイルはインデックスから外して None
+    """
+    try:
+        file = _execute('drive', service.files().get(
+            fileId=file_id, fields='id,trashed,thumbnailLink,webContentLink'
+        ), 'drive.get_file')
+    except HttpError as e:
+        if _is_not_found(e):
+            upload_index.forget_file(file_id)
+        else:
+            logger.warning(f"⚠️ Could not refresh uploaded file {file_id}: {e}")
+        return None
+    image_url = _image_url(file)
+    if file.get('trashed') or not image_url:
+        upload_index.forget_file(file_id)
+        return None
+    return {"file_id": file_id, "url": image_url}
+
+def _image_url(file):
+    thumbnail_link = file.get('thumbnailLink')
+    return thumbnail_link.replace('=s220', '=s3000') if thumbnail_link else file.get('webContentLink')
+
+def _create_drive_file(service, folder_id, stream, filename, mimetype='image/png'):
+    from googleapiclient.http import MediaIoBaseUpload
+    # 小さい画像は multipart (1往復)、大きい画像のみ resumable でチャンク送信
+    resumable = _stream_size(stream) > RESUMABLE_UPLOAD_THRESHOLD
+    stream.seek(0)
+    file_metadata = {'name': filename, 'parents': [folder_id]}
+    if resumable:
+        media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=RESUMABLE_CHUNK_SIZE, resumable=True)
+    else:
+        media = MediaIoBaseUpload(stream, mimetype=mimetype, resumable=False)
+    return _execute('drive', service.files().create(
+        body=file_metadata, 
+        media_body=media, 
+        fields='id, thumbnailLink, webContentLink'
+    ), 'drive.upload')
+
+def _stream_size(stream):
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def grant_public_read(token: str, uploads):
+    """
+    pending_grant の付いたアップロード結果に 'anyone reader' をバッチHTTPでまとめて付与する
+    付与に成功したファイルだけをアップロードインデックスに登録し、失敗したものは url を None にする
+    """
+    file_ids = list(dict.fromkeys(u['file_id'] for u in uploads if u and u.get('pending_grant')))
+    if not file_ids:
+        return []
+
+    service = _get_drive_service(_get_creds(token))
+    failed = []
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            logger.error(f"❌ Permission Error ({request_id}): {exception}")
+            failed.append(request_id)
+
+    for start in range(0, len(file_ids), PERMISSION_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_callback)
+        for file_id in file_ids[start:start + PERMISSION_BATCH_SIZE]:
+            batch.add(service.permissions().create(fileId=file_id, body=PUBLIC_READER, fields='id'), request_id=file_id)
+        try:
+            _execute('drive', batch, 'drive.permission_batch')
+        except Exception as e:
+            logger.error(f"❌ Permission Batch Error: {e}")
+            failed.extend(file_ids[start:start + PERMISSION_BATCH_SIZE])
+
+    logger.info(f"🔓 Granted public read to {len(file_ids) - len(failed)}/{len(file_ids)} files in batch")
+    user_id = None
+    for u in uploads:
+        if not u or not u.get('pending_grant'):
+            continue
+        u.pop('pending_grant')
+        if u['file_id'] in failed:
+            u['url'] = None
+        elif u.get('url') and u.get('digest'):
+            if user_id is None:
+                user_id = _get_user_id(token, service)
+            upload_index.put(user_id, u['digest'], u['file_id'])
+    return failed
+
+def _ensure_folder_public(service, folder_id):
+    """ folder モード: フォルダを1回だけ公開し、中のファイルは権限を継承させる """
+    _execute('drive', service.permissions().create(fileId=folder_id, body=PUBLIC_READER, fields='id'))
+
 def get_or_create_project_folder(token: str, folder_name="CyberSlide_Assets"):
     creds = _get_creds(token)
     service = _get_drive_service(creds)
-    query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-    results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-    files = results.get('files', [])
-    if files: return files[0]['id']
-    
-    file_metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder'}
-    file = service.files().create(body=file_metadata, fields='id').execute()
-    return file.get('id')
+    user_id = _get_user_id(token, service)
+
+    cached = folder_cache.get(user_id, folder_name)
+    if cached: return cached
+
+    with folder_cache.user_lock(user_id):
+        # ロック待ちの間に他のリクエストが作成済みかもしれない
+        cached = folder_cache.get(user_id, folder_name)
+        if cached: return cached
+
+        query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
+        results = _execute('drive', service.files().list(q=query, spaces='drive', fields='files(id)'), 'drive.folder_lookup')
+        files = results.get('files', [])
+        if files:
+            folder_id = files[0]['id']
+        else:
+            file_metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder'}
+            file = _execute('drive', service.files().create(body=file_metadata, fields='id'), 'drive.folder_create')
+            folder_id = file.get('id')
+
+        if DRIVE_PERMISSION_MODE == 'folder':
+            _ensure_folder_public(service, folder_id)
+
+        folder_cache.set(user_id, folder_name, folder_id)
+        return folder_id
 
 
 # --- Slides Operations ---
 
-def create_presentation_from_drive_images(token: str, title: str, slides_data: list):
+def create_presentation_from_drive_images(token: str, title: str, slides_data: list, progress=None, state=None):
+    """
+    Compile-then-Submit:
+    1. スライドIDをクライアント側で決めて (presentations().get 不要) デッキ全体のリクエストを組み立てる
+    2. できるだけ少ない batchUpdate で送信し、拒否された場合は二分割して原因スライドを特定
+    3. 原因スライドのみ画像モード (_add_only_image_background) に切り替える
+
+    progress: 進捗イベント (dict) を受け取るコールバック
+    state: 再開用の状態 (presentation_id / deck_key / structure_done / rendered)。
+           渡された dict を更新していくので、保存しておけば描画済みスライドを飛ばして再開できる
+    """
+    state = state if state is not None else {}
+    state.setdefault('rendered', [])
+    emit = progress or (lambda event: None)
+
     creds = _get_creds(token)
     slides_service = _get_slides_service(creds)
     
     # 画像保存用フォルダを確保
     folder_id = get_or_create_project_folder(token)
 
-    logger.info(f"🚀 Creating presentation: {title}")
-    presentation = slides_service.presentations().create(body={'title': title}).execute()
-    presentation_id = presentation.get('presentationId')
-    initial_slide_id = presentation.get('slides')[0]['objectId']
-    
-    # 白紙スライド作成
-    requests = []
-    for i in range(len(slides_data)):
-        requests.append({
-            'createSlide': {
-                'objectId': f"gen_slide_{i}_{int(time.time())}",
-                'insertionIndex': i + 1,
-                'slideLayoutReference': {'predefinedLayout': 'BLANK'}
-            }
-        })
-    requests.append({ 'deleteObject': { 'objectId': initial_slide_id } })
-    
-    if requests:
-        slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': requests}).execute()
-        requests = []
+    if not state.get('presentation_id'):
+        logger.info(f"🚀 Creating presentation: {title}")
+        presentation = _execute('slides', slides_service.presentations().create(body={'title': title}), 'slides.create')
+        state['presentation_id'] = presentation.get('presentationId')
+        state['initial_slide_id'] = presentation.get('slides')[0]['objectId']
+        state['deck_key'] = int(time.time())
+        emit({'stage': 'presentation_created', 'presentation_id': state['presentation_id']})
+        existing = {}
+    else:
+        logger.info(f"⏯️ Resuming presentation: {state['presentation_id']} ({len(state['rendered'])} slides already rendered)")
+        existing = _existing_object_ids(slides_service, state['presentation_id'])
+    presentation_id = state['presentation_id']
+
+    page_ids = [_page_object_id(s, i, state['deck_key']) for i, s in enumerate(slides_data)]
+    # 前回の batchUpdate は成功したが記録前に中断した場合、ページには既に要素がある → 描画済みとして扱う
+    for i, page_id in enumerate(page_ids):
+        if existing.get(page_id) and i not in state['rendered']:
+            logger.info(f"⏭️ Slide {i+1}: already rendered before interruption")
+            state['rendered'].append(i)
+    # 白紙スライド作成の batchUpdate は成功したが structure_done の記録前に中断した場合
+    if page_ids and all(page_id in existing for page_id in page_ids):
+        state['structure_done'] = True
+    taken_ids = set(page_ids).union(*existing.values())
 
-    pres = slides_service.presentations().get(presentationId=presentation_id).execute()
-    pages = pres.get('slides', [])
+    rendered = set(state['rendered'])
+    pending = [i for i in range(len(slides_data)) if i not in rendered]
 
-    # 各スライドの描画処理
+    # ★ デッキ全体の diagram_image を先に並列で生成 & アップロード
+    diagram_urls = _pregenerate_diagrams(token, folder_id, slides_data, skip=rendered)
+    emit({'stage': 'diagrams_ready'})
+
+    # 白紙スライド作成 (objectId はこちらで採番)
+    segments = []
+    if not state.get('structure_done'):
+        structure_requests = []
+        for i, page_id in enumerate(page_ids):
+            structure_requests.append({
+                'createSlide': {
+                    'objectId': page_id,
+                    'insertionIndex': i + 1,
+                    'slideLayoutReference': {'predefinedLayout': 'BLANK'}
+                }
+            })
+        structure_requests.append({ 'deleteObject': { 'objectId': state['initial_slide_id'] } })
+        segments.append({'index': None, 'requests': structure_requests})
+
+    # 各スライドの描画リクエストを組み立て
+    for i in pending:
+        seg = _compile_slide_segment(i, page_ids[i], slides_data[i], token, folder_id, diagram_urls.get(i, {}), taken_ids)
+        if seg.get('diagnostics'):
+            emit({'stage': 'preflight', 'index': i, 'diagnostics': seg['diagnostics']})
+        segments.append(seg)
+
+    failed = set()
+
+    def _on_done(seg, mode):
+        if seg['index'] is None:
+            state['structure_done'] = True
+            emit({'stage': 'slides_created', 'total': len(slides_data)})
+        else:
+            state['rendered'].append(seg['index'])
+            if mode == 'failed':
+                failed.add(seg['index'])
+            emit({'stage': 'slide_rendered', 'index': seg['index'], 'mode': mode, 'rendered': len(state['rendered']), 'total': len(slides_data)})
+
+    _submit_segments(slides_service, presentation_id, segments, _on_done)
+    _reset_failed_pages(slides_service, presentation_id, page_ids, failed)
+    return presentation_id
+
+
+def plan_presentation_update(token: str, presentation_id: str, slides_data: list):
+    """
+    差分エクスポートの計画を立てる (presentations.get 1回のみ / 画像のアップロード前に呼べる)
+    slides_data の指紋は背景画像の元データのハッシュ (with_background_hashes) から作る
+    戻り値: {'page_ids', 'changed', 'target', 'taken_ids', 'structure_requests', 'changes'}
+    存在しないプレゼンテーションは KeyError、権限が無い場合は PermissionError
+    """
+    slides_service = _get_slides_service(_get_creds(token))
+
+    # 実際のページ構成を取得 (ページIDに指紋が入っているのでこれだけで差分が取れる)
+    try:
+        presentation = _execute('slides', slides_service.presentations().get(
+            presentationId=presentation_id, fields='slides(objectId,pageElements(objectId))'
+        ), 'slides.get')
+    except HttpError as e:
+        if _is_not_found(e):
+            raise KeyError(presentation_id) from e
+        if getattr(e.resp, 'status', None) == 403:
+            raise PermissionError(presentation_id) from e
+        raise
+    current = [s['objectId'] for s in presentation.get('slides', [])]
+    taken_ids = set(current).union(*(
+        (el['objectId'] for el in s.get('pageElements', [])) for s in presentation.get('slides', [])
+    ))
+
+    generated = {page_id: GENERATED_PAGE_ID.match(page_id) for page_id in current}
+
+    # 同じ指紋のページを再利用 (同一内容のスライドが複数ある場合は出現順に割り当て)
+    reusable = {}
+    for page_id in current:
+        match = generated[page_id]
+        if match and match.group(1):
+            reusable.setdefault(match.group(1), []).append(page_id)
+    revision_key = time.time_ns() // 1_000_000
+    page_ids, changed = [], []
     for i, slide_item in enumerate(slides_data):
-        if i >= len(pages): break
-        page_id = pages[i]['objectId']
+        page_id = _page_object_id(slide_item, i, revision_key)
+        fp = GENERATED_PAGE_ID.match(page_id).group(1)
+        if reusable.get(fp):
+            page_ids.append(reusable[fp].pop(0))
+        else:
+            page_ids.append(page_id)
+            changed.append(i)
+    keep = set(page_ids)
+    removed = [page_id for page_id in current if generated[page_id] and page_id not in keep]
+
+    # 最終的な並び: 生成ページはスライド順、それ以外のページは今の位置 (index) のまま
+    target = list(page_ids)
+    for index, page_id in enumerate(current):
+        if not generated[page_id]:
+            target.insert(min(index, len(target)), page_id)
+
+    # 構造の変更: 追加 (末尾) → 削除 → 並べ替え。空のプレゼンテーションにならないよう作成を先に行う
+    structure_requests = [
+        {'createSlide': {'objectId': page_ids[i], 'slideLayoutReference': {'predefinedLayout': 'BLANK'}}}
+        for i in changed
+    ]
+    structure_requests += [{'deleteObject': {'objectId': page_id}} for page_id in removed]
+    order = [page_id for page_id in current if page_id not in removed] + [page_ids[i] for i in changed]
+    moved = 0
+    for target_index, page_id in enumerate(target):
+        index = order.index(page_id)
+        if index != target_index:
+            structure_requests.append({
+                'updateSlidesPosition': {'slideObjectIds': [page_id], 'insertionIndex': target_index}
+            })
+            order.insert(target_index, order.pop(index))
+            moved += 1
+
+    changes = {'rendered': len(changed), 'removed': len(removed), 'moved': moved, 'unchanged': len(slides_data) - len(changed)}
+    return {
+        'page_ids': page_ids,
+        'changed': changed,
+        'target': target,
+        'taken_ids': taken_ids,
+        'structure_requests': structure_requests,
+        'changes': changes,
+    }
+
+
+def update_presentation_from_drive_images(token: str, presentation_id: str, slides_data: list, progress=None, plan=None):
+    """
+    差分エクスポート: 既存ページの objectId に埋め込んだ指紋 (slide_fingerprint) と比較し、
+    追加 / 削除 / 並べ替え / 変更のあったスライドだけを batchUpdate で反映する
+    比較に使うのは presentations.get の結果だけ (ローカルに状態を持たない)
+    - 内容が同じスライドはページをそのまま再利用 (必要なら位置だけ移動)
+    - 変更されたスライドは新しいページとして描画し、古いページは削除
+    - このサーバーが作成していないページ (手動で追加したスライド等) は削除せず、位置も保つ
+
+    plan: plan_presentation_update の結果 (背景のアップロード前に差分を取った場合に渡す)
+          渡す場合、描画するのは plan['changed'] のスライドだけなので他のスライドの drive_url は不要
+    戻り値: (presentation_id, 変更内容の集計)
+    存在しないプレゼンテーションは KeyError、権限が無い場合は PermissionError
+    """
+    emit = progress or (lambda event: None)
+    slides_service = _get_slides_service(_get_creds(token))
+    plan = plan or plan_presentation_update(token, presentation_id, slides_data)
+    page_ids, changed, changes = plan['page_ids'], plan['changed'], plan['changes']
+    target, taken_ids = plan['target'], set(plan['taken_ids'])
+
+    logger.info(f"🔁 Incremental export {presentation_id}: {changes}")
+    emit({'stage': 'diff_ready', **changes})
+    if not plan['structure_requests']:
+        return presentation_id, changes
+
+    folder_id = get_or_create_project_folder(token)
+    unchanged = set(range(len(slides_data))) - set(changed)
+    diagram_urls = _pregenerate_diagrams(token, folder_id, slides_data, skip=unchanged)
+    emit({'stage': 'diagrams_ready'})
+
+    segments = [{'index': None, 'requests': plan['structure_requests']}]
+    taken_ids.update(page_ids)
+    for i in changed:
+        seg = _compile_slide_segment(i, page_ids[i], slides_data[i], token, folder_id, diagram_urls.get(i, {}), taken_ids)
+        if seg.get('diagnostics'):
+            emit({'stage': 'preflight', 'index': i, 'diagnostics': seg['diagnostics']})
+        segments.append(seg)
+
+    failed = set()
+
+    def _on_done(seg, mode):
+        if seg['index'] is None:
+            emit({'stage': 'slides_updated', 'total': len(slides_data)})
+        else:
+            if mode == 'failed':
+                failed.add(seg['index'])
+            emit({'stage': 'slide_rendered', 'index': seg['index'], 'mode': mode, 'total': len(slides_data)})
+
+    _submit_segments(slides_service, presentation_id, segments, _on_done)
+    _reset_failed_pages(slides_service, presentation_id, target, failed, page_ids)
+    return presentation_id, changes
+
+
+def slide_fingerprint(slide_item):
+    """ 描画結果を左右する内容 (タイトル / remake_data / 背景画像) から指紋を作る """
+    background = slide_item.get('background_hash') or slide_item.get('drive_url')
+    return make_key(slide_item.get('title'), slide_item.get('remake_data'), background)
+
+
+def with_background_hashes(slides: list, background_files: dict = None):
+    """
+    背景画像の元データ (縮小・再圧縮の前) のハッシュを background_hash に入れたコピーを返す
+    アップロードせずに指紋を計算できるので、差分エクスポートは先に差分を取ってから変更分だけ送れる
+    """
+    background_files = background_files or {}
+    hashed = []
+    for i, slide in enumerate(slides):
+        slide = slide.copy()
+        if i in background_files:
+            slide['background_hash'] = stream_hash(background_files[i])
+        elif slide.get('backgroundImage'):
+            slide['background_hash'] = content_hash(base64.b64decode(slide['backgroundImage']))
+        hashed.append(slide)
+    return hashed
+
+
+def _page_object_id(slide_item, index, revision_key):
+    return f"gen_{slide_fingerprint(slide_item)[:PAGE_FINGERPRINT_LENGTH]}_{index}_{revision_key}"
+
+
+def _reset_failed_pages(slides_service, presentation_id, order, failed, page_ids=None):
+    """
+    描画に失敗したページを指紋の無い白紙ページに差し替える (次回の差分エクスポートで再描画させる)
+    order: プレゼンテーション内のページの並び / page_ids: スライド index → ページID (省略時は order)
+    """
+    if not failed:
+        return
+    page_ids = page_ids or order
+    revision_key = time.time_ns() // 1_000_000
+    requests = []
+    for i in sorted(failed):
+        requests.append({'createSlide': {
+            'objectId': f"gen_slide_{i}_{revision_key}",
+            'insertionIndex': order.index(page_ids[i]),
+            'slideLayoutReference': {'predefinedLayout': 'BLANK'},
+        }})
+        requests.append({'deleteObject': {'objectId': page_ids[i]}})
+    try:
+        _execute('slides', slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': requests}), 'slides.reset_failed')
+    except HttpError as e:
+        logger.warning(f"⚠️ Could not reset {len(failed)} failed page(s) in {presentation_id}: {e}")
+
+
+def _compile_slide_segment(i, page_id, slide_item, token, folder_id, diagram_urls, taken_ids=None):
+    """
+    1スライド分のリクエストを組み立てる (ベクター → 失敗時は画像モード)
+    ベクターの場合は送信前に preflight_requests で検証・修復し、API に拒否されて往復が増えるのを防ぐ
+    taken_ids: デッキ内で使用済みの objectId (衝突回避用)
+    """
+    if _is_vector_slide(slide_item):
+        logger.info(f"🎨 Slide {i+1}: Hybrid Vector Rendering...")
         slide_requests = []
-        
-        remake_data = slide_item.get('remake_data')
-        is_vector_mode = False
-        
-        if remake_data and isinstance(remake_data, dict):
-            if remake_data.get('elements') and len(remake_data.get('elements', [])) > 0:
-                is_vector_mode = True
+        try:
+            # ★ tokenとfolder_idを渡す (画像再生成用)
+            _add_remake_requests(slide_requests, page_id, slide_item['remake_data'], token, folder_id, diagram_urls)
+            slide_requests, diagnostics = preflight_requests(slide_requests, page_id, taken_ids)
+            if slide_requests:
+                return {'index': i, 'page_id': page_id, 'slide_item': slide_item, 'is_vector': True,
+                        'requests': slide_requests, 'diagnostics': diagnostics}
+        except Exception as e:
+            logger.error(f"❌ Slide {i+1}: Logic Error: {e}")
+            record_fallback('logic_error')
 
-        if is_vector_mode:
-            logger.info(f"🎨 Slide {i+1}: Hybrid Vector Rendering...")
-            try:
-                # ★ tokenとfolder_idを渡す (画像再生成用)
-                _add_remake_requests(slide_requests, page_id, remake_data, token, folder_id)
-                
-                if slide_requests:
-                    slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': slide_requests}).execute()
-                    logger.info(f"✅ Slide {i+1}: Render Success!")
-                    continue 
-
-            except HttpError as e:
-                logger.error(f"❌ Slide {i+1}: Vector Render Rejected! Reason: {e}")
-                logger.info(f"🔄 Slide {i+1}: Falling back to Image Mode...")
-                slide_requests = [] 
-            except Exception as e:
-                logger.error(f"❌ Slide {i+1}: Logic Error: {e}")
-                slide_requests = []
+    # フォールバック (画像モード)
+    logger.info(f"🖼️ Slide {i+1}: Fallback/Default Image Mode")
+    slide_requests = []
+    _add_only_image_background(slide_requests, page_id, slide_item)
+    return {'index': i, 'page_id': page_id, 'slide_item': slide_item, 'is_vector': False, 'requests': slide_requests}
 
-        # フォールバック (画像モード)
-        logger.info(f"🖼️ Slide {i+1}: Fallback/Default Image Mode")
-        _add_only_image_background(slide_requests, page_id, slide_item)
-        
-        if slide_requests:
+
+def _chunk_segments(segments, max_requests=MAX_REQUESTS_PER_BATCH):
+    """ 1回の batchUpdate が大きくなりすぎないようスライド単位で区切る """
+    chunk, count = [], 0
+    for seg in segments:
+        n = len(seg['requests'])
+        if chunk and count + n > max_requests:
+            yield chunk
+            chunk, count = [], 0
+        chunk.append(seg)
+        count += n
+    if chunk:
+        yield chunk
+
+
+def _submit_segments(slides_service, presentation_id, segments, on_done=None):
+    """ on_done(segment, mode): セグメントの送信が確定するたびに呼ばれる (mode: vector / image / failed) """
+    on_done = on_done or (lambda seg, mode: None)
+    for chunk in _chunk_segments(segments):
+        _submit_bisect(slides_service, presentation_id, chunk, on_done)
+
+
+def _segment_mode(seg):
+    if seg['index'] is None:
+        return 'structure'
+    return 'vector' if seg.get('is_vector') else 'image'
+
+
+def _submit_bisect(slides_service, presentation_id, segments, on_done):
+    """
+    batchUpdate はアトミックなので、拒否されたら半分に分けて再送し、原因スライドを特定する
+    """
+    requests = [r for seg in segments for r in seg['requests']]
+    try:
+        if requests:
+            _execute('slides', slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': requests}), 'slides.batch_update')
+        for seg in segments:
+            if seg.get('is_vector'):
+                logger.info(f"✅ Slide {seg['index']+1}: Render Success!")
+            on_done(seg, _segment_mode(seg))
+        return
+    except HttpError as e:
+        if len(segments) > 1:
+            logger.info(f"🪓 Batch of {len(segments)} segments rejected. Bisecting...")
+            mid = len(segments) // 2
+            _submit_bisect(slides_service, presentation_id, segments[:mid], on_done)
+            _submit_bisect(slides_service, presentation_id, segments[mid:], on_done)
+            return
+        error = e
+
+    seg = segments[0]
+    if seg['index'] is None:
+        # スライド作成そのものが失敗した場合は続行不可
+        raise error
+
+    if not seg.get('is_vector'):
+        logger.error(f"💀 Slide {seg['index']+1}: Critical Error: {error}")
+        on_done(seg, 'failed')
+        return
+
+    logger.error(f"❌ Slide {seg['index']+1}: Vector Render Rejected! Reason: {error}")
+    logger.info(f"🔄 Slide {seg['index']+1}: Falling back to Image Mode...")
+    record_fallback('rejected')
+    fallback_requests = []
+    _add_only_image_background(fallback_requests, seg['page_id'], seg['slide_item'])
+    mode = 'image'
+    if fallback_requests:
+        try:
+            _execute('slides', slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': fallback_requests}), 'slides.batch_update_fallback')
+        except Exception as e:
+            logger.error(f"💀 Slide {seg['index']+1}: Critical Error: {e}")
+            mode = 'failed'
+    on_done(seg, mode)
+
+
+def _existing_object_ids(slides_service, presentation_id):
+    """ 再開時用: { ページID: {要素の objectId} } """
+    presentation = _execute('slides', slides_service.presentations().get(
+        presentationId=presentation_id, fields='slides(objectId,pageElements(objectId))'
+    ), 'slides.get')
+    return {
+        s['objectId']: {el['objectId'] for el in s.get('pageElements', [])}
+        for s in presentation.get('slides', [])
+    }
+
+
+def _is_vector_slide(slide_item):
+    remake_data = slide_item.get('remake_data')
+    return isinstance(remake_data, dict) and len(remake_data.get('elements') or []) > 0
+
+def _generate_and_upload_diagram(token, folder_id, prompt, filename, grant_public=True):
+    logger.info(f"🖼️ Regenerating Diagram: {prompt[:40]}...")
+    gen_base64 = generate_image(prompt)
+    if not gen_base64:
+        return None
+    upload_res = upload_image_to_drive(token, folder_id, gen_base64, filename, grant_public=grant_public)
+    if upload_res and upload_res.get('url'):
+        return upload_res
+    return None
+
+def _pregenerate_diagrams(token, folder_id, slides_data, max_workers=DIAGRAM_CONCURRENCY, skip=()):
+    """
+    Planning Pass: デッキ内の全 diagram_image を収集し、共有プールで並列に生成 & アップロード
+    同じプロンプト (空白を正規化して比較) は1回だけ生成し、その URL を使う要素すべてに配る
+    戻り値: { slide_index: { element_index: url } } (失敗した要素は含まれない → 従来どおりスキップ)
+    """
+    jobs = {}  # normalized prompt -> { 'prompt': 元のプロンプト, 'targets': [(slide_index, element_index)] }
+    diagram_urls = {}
+    for i, slide_item in enumerate(slides_data):
+        if i in skip or not _is_vector_slide(slide_item):
+            continue
+        elements, _ = optimize_elements(slide_item['remake_data']['elements'])
+        for idx, el in elements:
+            if el.get('type') == 'diagram_image' and el.get('prompt'):
+                job = jobs.setdefault(normalize_prompt(el['prompt']), {'prompt': el['prompt'], 'targets': []})
+                job['targets'].append((i, idx))
+                diagram_urls.setdefault(i, {})
+    if not jobs:
+        return diagram_urls
+
+    total = sum(len(job['targets']) for job in jobs.values())
+    logger.info(f"🧩 Pre-generating {len(jobs)} diagrams for {total} elements (workers={max_workers})...")
+    timestamp = int(time.time())
+    # 呼び出し元も共有プール上で動くことがあるため、投入は max_workers 件ずつに抑えてプールを埋め尽くさない
+    pool = get_executor()
+    pending = {}
+    uploads = {}
+    queue = list(enumerate(jobs.values()))
+    while queue or pending:
+        while queue and len(pending) < max(1, max_workers):
+            n, job = queue.pop(0)
+            i, idx = job['targets'][0]
+            future = pool.submit(
+                contextvars.copy_context().run,
+                _generate_and_upload_diagram, token, folder_id, job['prompt'], f"diagram_{i}_{idx}_{timestamp}.png", False
+            )
+            pending[future] = (n, job)
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            n, job = pending.pop(future)
             try:
-                slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': slide_requests}).execute()
+                uploads[n] = (job, future.result())
             except Exception as e:
-                logger.error(f"💀 Slide {i+1}: Critical Error: {e}")
+                i, idx = job['targets'][0]
+                logger.error(f"❌ Diagram {i+1}-{idx}: Generation Error: {e}")
 
-    return presentation_id
+    # 公開権限はまとめて付与
+    grant_public_read(token, [res for _, res in uploads.values()])
+    for job, res in uploads.values():
+        if res and res.get('url'):
+            for i, idx in job['targets']:
+                diagram_urls[i][idx] = res['url']
+    return diagram_urls
 
-
-def _add_remake_requests(requests, page_id, remake_data, token, folder_id):
-    """ Hybrid Vector Mode Request Builder """
+def _add_remake_requests(requests, page_id, remake_data, token, folder_id, diagram_urls=None):
+    """
+    Hybrid Vector Mode Request Builder
+    diagram_urls: { element_index: url } (事前生成済み)。None の場合はその場で生成する
+    """
     
     SCALE_X = 720.0 / 960.0
     SCALE_Y = 405.0 / 540.0
@@ -186,15 +824,18 @@ def _add_remake_requests(requests, page_id, remake_data, token, folder_id):
         }
     })
 
-    elements = remake_data.get('elements', [])
-    for idx, el in enumerate(elements):
+    # ★ 最適化パス (不可視・画面外・隠れた要素の削除 / テキスト結合)
+    elements, report = optimize_elements(remake_data.get('elements', []))
+    if report['requests_removed'] > 0:
+        logger.info(f"✂️ Optimizer: {report['input']} -> {report['output']} elements, {report['requests_removed']} requests removed {report}")
+    for idx, el in elements:
         el_type = el.get('type')
-        bbox = el.get('bbox', [0,0,100,100])
-        
-        x = max(0, bbox[0] * SCALE_X)
-        y = max(0, bbox[1] * SCALE_Y)
-        w = max(1, bbox[2] * SCALE_X) 
-        h = max(1, bbox[3] * SCALE_Y) 
+        # 数値にできない値は None のまま渡し、preflight_requests で修復する
+        x, y, w, h = _bbox_to_points(el.get('bbox', [0,0,100,100]), SCALE_X, SCALE_Y)
+        x = max(0, x) if x is not None else None
+        y = max(0, y) if y is not None else None
+        w = max(1, w) if w is not None else None
+        h = max(1, h) if h is not None else None
         
         obj_id = f"{page_id}_el_{idx}"
         rgb = _safe_hex_to_rgb(el.get('color', '#000000'))
@@ -209,29 +850,27 @@ def _add_remake_requests(requests, page_id, remake_data, token, folder_id):
         # --- ★ Type D: Diagram Image (再生成＆配置) ---
         if el_type == 'diagram_image':
             prompt = el.get('prompt')
-            if prompt:
-                logger.info(f"🖼️ Regenerating Diagram: {prompt[:40]}...")
-                # 1. 画像生成
-                gen_base64 = generate_image(prompt)
-                if gen_base64:
-                    # 2. Driveへアップロード
-                    timestamp = int(time.time())
-                    upload_res = upload_image_to_drive(token, folder_id, gen_base64, f"diagram_{idx}_{timestamp}.png")
-                    
-                    if upload_res and upload_res.get('url'):
-                        # 3. スライドに配置
-                        requests.append({
-                            'createImage': {
-                                'objectId': obj_id,
-                                'url': upload_res['url'],
-                                'elementProperties': {
-                                    'pageObjectId': page_id,
-                                    'size': {'width': {'magnitude': w, 'unit': 'PT'}, 'height': {'magnitude': h, 'unit': 'PT'}},
-                                    'transform': {'scaleX': 1, 'scaleY': 1, 'translateX': x, 'translateY': y, 'unit': 'PT'}
-                                }
-                            }
-                        })
-                        continue # 画像が成功したら、この要素の処理は完了
+            image_url = None
+            if diagram_urls is not None:
+                image_url = diagram_urls.get(idx)
+            elif prompt:
+                upload_res = _generate_and_upload_diagram(token, folder_id, prompt, f"diagram_{idx}_{int(time.time())}.png")
+                image_url = upload_res['url'] if upload_res else None
+
+            if image_url:
+                # スライドに配置
+                requests.append({
+                    'createImage': {
+                        'objectId': obj_id,
+                        'url': image_url,
+                        'elementProperties': {
+                            'pageObjectId': page_id,
+                            'size': {'width': {'magnitude': w, 'unit': 'PT'}, 'height': {'magnitude': h, 'unit': 'PT'}},
+                            'transform': {'scaleX': 1, 'scaleY': 1, 'translateX': x, 'translateY': y, 'unit': 'PT'}
+                        }
+                    }
+                })
+                continue # 画像が成功したら、この要素の処理は完了
 
         # --- Type A: Text ---
         if el_type == 'text':
@@ -273,15 +912,17 @@ def _add_remake_requests(requests, page_id, remake_data, token, folder_id):
                 }
             })
             
-            align_raw = el.get('align', 'left').lower()
-            align_map = {'left': 'START', 'center': 'CENTER', 'right': 'END', 'justify': 'JUSTIFIED'}
-            requests.append({
-                 'updateParagraphStyle': {
-                     'objectId': obj_id,
-                     'style': {'alignment': align_map.get(align_raw, 'START')},
-                     'fields': 'alignment'
-                 }
-            })
+            # 左揃え (START) は TEXT_BOX の既定値なので送らない
+            if needs_paragraph_style(el):
+                align_raw = el.get('align', 'left').lower()
+                align_map = {'left': 'START', 'center': 'CENTER', 'right': 'END', 'justify': 'JUSTIFIED'}
+                requests.append({
+                     'updateParagraphStyle': {
+                         'objectId': obj_id,
+                         'style': {'alignment': align_map.get(align_raw, 'START')},
+                         'fields': 'alignment'
+                     }
+                })
 
         # --- Type B: Shape ---
         elif el_type == 'shape':
@@ -353,6 +994,17 @@ def _add_remake_requests(requests, page_id, remake_data, token, folder_id):
             })
 
 
+def _bbox_to_points(bbox, scale_x, scale_y):
+    values = list(bbox) if isinstance(bbox, (list, tuple)) else []
+    points = []
+    for k, scale in enumerate((scale_x, scale_y, scale_x, scale_y)):
+        try:
+            points.append(float(values[k]) * scale)
+        except (IndexError, TypeError, ValueError):
+            points.append(None)
+    return points
+
+
 def _add_only_image_background(requests, page_id, slide_item):
     """ Fallback: Image Mode """
     if slide_item.get('drive_url'):
@@ -366,4 +1018,73 @@ def _add_only_image_background(requests, page_id, slide_item):
                 },
                 'fields': 'pageBackgroundFill'
             }
-        })
\ No newline at end of file
+        })
+
+# --- ⚡ Async Variants (スレッドプール経由) ---
+
+async def upload_image_to_drive_async(token: str, folder_id: str, image_base64: str, filename: str):
+    return await run_blocking(upload_image_to_drive, token, folder_id, image_base64, filename)
+
+async def get_or_create_project_folder_async(token: str, folder_name="CyberSlide_Assets"):
+    return await run_blocking(get_or_create_project_folder, token, folder_name)
+
+async def create_presentation_from_drive_images_async(token: str, title: str, slides_data: list, progress=None):
+    return await run_blocking(create_presentation_from_drive_images, token, title, slides_data, progress)
+
+async def plan_presentation_update_async(token: str, presentation_id: str, slides_data: list):
+    return await run_blocking(plan_presentation_update, token, presentation_id, slides_data)
+
+async def update_presentation_from_drive_images_async(token: str, presentation_id: str, slides_data: list, progress=None, plan=None):
+    return await run_blocking(update_presentation_from_drive_images, token, presentation_id, slides_data, progress, plan)
+
+async def upload_image_stream_to_drive_async(token: str, folder_id: str, stream, filename: str, mimetype: str = 'image/png', grant_public: bool = True):
+    return await run_blocking(upload_image_stream_to_drive, token, folder_id, stream, filename, mimetype, grant_public)
+
+async def upload_slide_backgrounds_async(token: str, folder_id: str, slides: list, max_concurrency: int = UPLOAD_CONCURRENCY, background_files: dict = None, only=None):
+    """
+    各スライドの backgroundImage を並列に Drive へアップロードし、drive_url を付与したコピーを返す
+    - スライドの順序は維持
+    - 1枚の失敗は他のスライドに影響しない (drive_url 無しで返す → 後段で画像無しとして扱う)
+    - background_files: { slide_index: ファイルライク } (multipart で受け取った画像をコピー無しで送る)
+    - only: アップロードするスライド index の集合 (差分エクスポートで変更分だけ送る場合)。省略時は全スライド
+    - background_hash には元データのハッシュを入れる (with_background_hashes と同じ値)
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    background_files = background_files or {}
+
+    async def _upload_one(i, slide):
+        new_slide = slide.copy()
+        stream = background_files.get(i)
+        if only is not None and i not in only:
+            new_slide.pop("backgroundImage", None)
+            return new_slide, None
+        if stream is None and not slide.get("backgroundImage"):
+            return new_slide, None
+        async with semaphore:
+            try:
+                if stream is not None:
+                    source = stream
+                    new_slide["background_hash"] = await run_blocking(stream_hash, stream)
+                else:
+                    source = base64.b64decode(slide["backgroundImage"])
+                    new_slide["background_hash"] = content_hash(source)
+                # スライド解像度へ縮小 & 再圧縮してからアップロード
+                upload_stream, mimetype = await prepare_for_background_async(source)
+                res = await upload_image_stream_to_drive_async(
+                    token, folder_id, upload_stream, f"slide_bg_{i}.{extension_for(mimetype)}", mimetype, grant_public=False
+                )
+            except Exception as e:
+                logger.error(f"❌ Slide {i+1}: Background Upload Error: {e}")
+                res = None
+        return new_slide, res
+
+    results = await asyncio.gather(*[_upload_one(i, slide) for i, slide in enumerate(slides)])
+
+    # 公開権限はバッチでまとめて付与
+    await run_blocking(grant_public_read, token, [res for _, res in results if res])
+    processed_slides = []
+    for new_slide, res in results:
+        if res and res.get("url"):
+            new_slide["drive_url"] = res["url"]
+        processed_slides.append(new_slide)
+    return processed_slides
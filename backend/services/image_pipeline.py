@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- ⚙️ Settings ---
+IMAGE_PIPELINE_ENABLED = os.getenv("IMAGE_PIPELINE_ENABLED", "1") != "0"
+IMAGE_PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# レイアウト座標は 960x540 基準なので解析には高さ540で十分
+VISION_IMAGE_HEIGHT = int(os.getenv("VISION_IMAGE_HEIGHT", "540"))
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+# 背景画像はスライド表示解像度 (16:9, 1920x1080) まで
+BACKGROUND_IMAGE_HEIGHT = int(os.getenv("BACKGROUND_IMAGE_HEIGHT", "1080"))
+BACKGROUND_IMAGE_QUALITY = int(os.getenv("BACKGROUND_IMAGE_QUALITY", "88"))
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS, thread_name_prefix="image-pipeline")
+    return _pool
+
+
+# --- 🖼️ Normalize & Recompress ---
+
+def normalize_image(source, max_height: int, quality: int, mime_type: str = "image/png"):
+    """
+    高さ max_height まで縮小し、JPEG (透過がある場合は PNG) で再エンコードする
+    source: bytes またはファイルライク
+    戻り値: (bytes, mime_type) ※元より大きくなる / 失敗した場合は元データをそのまま返す
+    """
+    original = source if isinstance(source, (bytes, bytearray)) else None
+    stream = io.BytesIO(source) if original is not None else source
+    try:
+        stream.seek(0)
+        from PIL import Image  # Pillow は初回の変換時に読み込む
+        with Image.open(stream) as img:
+            img.load()
+            if img.height > max_height:
+                width = max(1, round(img.width * max_height / img.height))
+                img = img.resize((width, max_height), Image.LANCZOS)
+
+            out = io.BytesIO()
+            if _has_alpha(img):
+                img.save(out, format="PNG", optimize=True)
+                out_mime = "image/png"
+            else:
+                img.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+                out_mime = "image/jpeg"
+
+        original_size = len(original) if original is not None else _stream_size(stream)
+        if out.tell() >= original_size:
+            return _original(source, stream), mime_type
+        return out.getvalue(), out_mime
+    except Exception as e:
+        logger.warning(f"⚠️ Image normalize skipped: {e}")
+        return _original(source, stream), mime_type
+
+def prepare_for_vision(image_bytes: bytes, mime_type: str = "image/png"):
+    if not IMAGE_PIPELINE_ENABLED:
+        return image_bytes, mime_type
+    return normalize_image(image_bytes, VISION_IMAGE_HEIGHT, VISION_IMAGE_QUALITY, mime_type)
+
+def prepare_for_background(source, mime_type: str = "image/png"):
+    """ 背景画像用: 戻り値は (ファイルライク, mime_type) """
+    if not IMAGE_PIPELINE_ENABLED:
+        return _as_stream(source), mime_type
+    data, out_mime = normalize_image(source, BACKGROUND_IMAGE_HEIGHT, BACKGROUND_IMAGE_QUALITY, mime_type)
+    return _as_stream(data), out_mime
+
+async def prepare_for_vision_async(image_bytes: bytes, mime_type: str = "image/png"):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), contextvars.copy_context().run, prepare_for_vision, image_bytes, mime_type)
+
+async def prepare_for_background_async(source, mime_type: str = "image/png"):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), contextvars.copy_context().run, prepare_for_background, source, mime_type)
+
+def extension_for(mime_type: str):
+    return {"image/jpeg": "jpg", "image/png": "png"}.get(mime_type, "png")
+
+def warm_up():
+    """ Pillow のプラグイン読み込みと変換用プールの起動を先に済ませる """
+    from PIL import Image
+    Image.init()
+    _get_pool()
+
+def shutdown_pipeline():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+# --- 🛠️ Helpers ---
+
+def _has_alpha(img):
+    if img.mode in ("RGBA", "LA"):
+        return img.getextrema()[-1][0] < 255
+    return img.mode == "P" and "transparency" in img.info
+
+def _stream_size(stream):
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def _original(source, stream):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    stream.seek(0)
+    return stream
+
+def _as_stream(data):
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
@@ -0,0 +1,109 @@
+import contextvars
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# --- 🔗 Correlation ID (1リクエスト / 1エクスポートジョブ単位) ---
+correlation_id = contextvars.ContextVar("correlation_id", default="-")
+
+def new_correlation_id():
+    return uuid.uuid4().hex[:16]
+
+# --- 📊 Metrics ---
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "cyberslide_stage_duration_seconds",
+    "Latency of each backend stage (model call, upload, folder lookup, batchUpdate, export)",
+    ["stage", "target"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_TOTAL = Counter(
+    "cyberslide_stage_total",
+    "Number of stage executions by outcome",
+    ["stage", "target", "outcome"],
+)
+FALLBACK_TOTAL = Counter(
+    "cyberslide_fallback_total",
+    "Slides rendered in image mode instead of vector mode",
+    ["reason"],
+)
+LIMITER_CONCURRENCY = Gauge(
+    "cyberslide_limiter_concurrency_limit",
+    "Current AIMD concurrency limit per API / model",
+    ["api"],
+)
+LIMITER_IN_FLIGHT = Gauge(
+    "cyberslide_limiter_in_flight",
+    "Calls currently in flight per API / model",
+    ["api"],
+)
+LIMITER_RETRIES = Counter(
+    "cyberslide_limiter_retries",
+    "Retries performed per API / model",
+    ["api"],
+)
+LIMITER_THROTTLED = Counter(
+    "cyberslide_limiter_throttled",
+    "429 responses received per API / model",
+    ["api"],
+)
+CACHE_LOOKUPS = Counter(
+    "cyberslide_cache_lookups",
+    "Local disk cache lookups (image / layout) by result",
+    ["cache", "result"],
+)
+STARTUP_SECONDS = Gauge(
+    "cyberslide_startup_seconds",
+    "Time spent in each cold-start phase (module import, warm-up steps)",
+    ["phase"],
+)
+
+
+@contextmanager
+def span(stage: str, target: str = ""):
+    """ 処理時間をヒストグラムに記録し、相関IDつきでログに残す """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage, target).observe(elapsed)
+        STAGE_TOTAL.labels(stage, target, outcome).inc()
+        logger.info(f"⏱️ [{correlation_id.get()}] {stage}{f' ({target})' if target else ''}: {elapsed*1000:.0f}ms {outcome}")
+
+def record_fallback(reason: str):
+    FALLBACK_TOTAL.labels(reason).inc()
+
+def record_limiter_retry(api: str, throttled: bool):
+    LIMITER_RETRIES.labels(api).inc()
+    if throttled:
+        LIMITER_THROTTLED.labels(api).inc()
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_startup(phase: str, seconds: float):
+    STARTUP_SECONDS.labels(phase).set(seconds)
+    logger.info(f"🚀 Startup {phase}: {seconds*1000:.0f}ms")
+
+def render_metrics():
+    """ Prometheus テキスト形式 (body, content_type) """
+    _collect_limiter_stats()
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def _collect_limiter_stats():
+    """ レートリミッターの現在値をスクレイプ時点の値でゲージに反映する (リトライ数は発生時にカウンタへ記録済み) """
+    from services.rate_limit import all_limiter_stats
+    for stats in all_limiter_stats():
+        LIMITER_CONCURRENCY.labels(stats["name"]).set(stats["concurrency_limit"])
+        LIMITER_IN_FLIGHT.labels(stats["name"]).set(stats["in_flight"])
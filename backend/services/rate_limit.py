@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from services.metrics import record_limiter_retry
+
+logger = logging.getLogger(__name__)
+
+# --- ⚙️ Settings ---
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "32.0"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# API / モデルごとの既定値 (RATE_LIMIT_<NAME>_QPS / _BURST / _MAX_CONCURRENCY で上書き)
+DEFAULT_LIMITS = {
+    "drive": {"qps": 10.0, "burst": 20, "max_concurrency": 16},
+    "slides": {"qps": 5.0, "burst": 10, "max_concurrency": 8},
+}
+DEFAULT_MODEL_LIMIT = {"qps": 2.0, "burst": 4, "max_concurrency": 8}
+
+
+class TokenBucket:
+    """ rate (トークン/秒) で補充され、最大 burst 個まで貯まるバケット """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """ トークンを1つ予約し、使えるようになるまでの待ち時間を返す """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    同時実行数を AIMD で調整する
+    - 成功が limit 回続くごとに +1 (加算増加)
+    - スロットル (429 等) を受けたら半分 (乗算減少)
+    - リトライ対象外のエラー (400 / 403 等) は混雑の指標にならないので limit を変えない
+    """
+
+    def __init__(self, max_concurrency: int, initial: int = None):
+        self.max_limit = max(1, max_concurrency)
+        self.limit = float(initial or self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def _try_enter(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def enter(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def enter_async(self):
+        while not self._try_enter():
+            await asyncio.sleep(0.05)
+
+    def leave(self, throttled: bool = None):
+        """ throttled: True = スロットル / False = 成功 / None = 調整しない """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            elif throttled is not None:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / max(1.0, self.limit))
+            self._cond.notify_all()
+
+
+class ApiLimiter:
+    """ トークンバケット + AIMD + ジッター付き指数バックオフのリトライ """
+
+    def __init__(self, name: str, qps: float, burst: int, max_concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(qps, burst)
+        self.concurrency = AIMDLimiter(max_concurrency)
+        self.retries = 0
+        self.throttled = 0
+
+    def call(self, func, *args, **kwargs):
+        """ 同期呼び出し (リトライ可能なエラーはバックオフして再試行) """
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            self.bucket.acquire()
+            self.concurrency.enter()
+            throttled = None
+            try:
+                result = func(*args, **kwargs)
+                throttled = False
+                return result
+            except Exception as e:
+                if is_retryable(e):
+                    throttled = True
+                if not throttled or attempt == RETRY_MAX_ATTEMPTS - 1:
+                    raise
+                delay = self._on_retry(e, attempt)
+            finally:
+                self.concurrency.leave(throttled)
+            time.sleep(delay)
+
+    async def call_async(self, coro_factory):
+        """ 非同期呼び出し: coro_factory は呼ぶたびに新しいコルーチンを返す関数 """
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            await self.bucket.acquire_async()
+            await self.concurrency.enter_async()
+            throttled = None
+            try:
+                result = await coro_factory()
+                throttled = False
+                return result
+            except Exception as e:
+                if is_retryable(e):
+                    throttled = True
+                if not throttled or attempt == RETRY_MAX_ATTEMPTS - 1:
+                    raise
+                delay = self._on_retry(e, attempt)
+            finally:
+                self.concurrency.leave(throttled)
+            await asyncio.sleep(delay)
+
+    def _on_retry(self, error, attempt):
+        self.retries += 1
+        throttled = error_status(error) == 429
+        if throttled:
+            self.throttled += 1
+        record_limiter_retry(self.name, throttled)
+        delay = backoff_delay(attempt)
+        logger.warning(f"⏳ [{self.name}] Retryable error ({error_status(error)}), retry {attempt+1} in {delay:.1f}s: {error}")
+        return delay
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+
+# --- 🛠️ Helpers ---
+
+def error_status(error):
+    """ googleapiclient の HttpError (resp.status) / google.api_core の例外 (code) から HTTP ステータスを取り出す """
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error):
+    return error_status(error) in RETRYABLE_STATUSES
+
+def backoff_delay(attempt: int):
+    """ Full Jitter: 0 〜 min(上限, base * 2^attempt) の一様乱数 """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(name: str):
+    """ API 名 ('drive' / 'slides') またはモデル名ごとに共有の ApiLimiter を返す """
+    limiter = _limiters.get(name)
+    if limiter is not None:
+        return limiter
+    with _limiters_lock:
+        if name not in _limiters:
+            defaults = DEFAULT_LIMITS.get(name, DEFAULT_MODEL_LIMIT)
+            env_key = re.sub(r"[^A-Z0-9]+", "_", name.upper()).strip("_")
+            _limiters[name] = ApiLimiter(
+                name,
+                qps=float(os.getenv(f"RATE_LIMIT_{env_key}_QPS", defaults["qps"])),
+                burst=int(os.getenv(f"RATE_LIMIT_{env_key}_BURST", defaults["burst"])),
+                max_concurrency=int(os.getenv(f"RATE_LIMIT_{env_key}_MAX_CONCURRENCY", defaults["max_concurrency"])),
+            )
+        return _limiters[name]
+
+def all_limiter_stats():
+    return [limiter.stats() for limiter in list(_limiters.values())]
@@ -0,0 +1,159 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- 📐 解析座標系 (analyze_slide_for_remake の bbox 基準) ---
+CANVAS_W = 960.0
+CANVAS_H = 540.0
+
+MIN_VISIBLE_OPACITY = 0.01
+# テキスト結合の許容誤差 (px)
+MERGE_X_TOLERANCE = 2.0
+MERGE_W_TOLERANCE = 4.0
+MERGE_GAP_RATIO = 0.5  # 行間ギャップが fontSize の何倍以内なら連続とみなすか
+
+# 要素タイプごとの batchUpdate リクエスト数 (_add_remake_requests と対応)
+REQUESTS_PER_TYPE = {'text': 4, 'shape': 2, 'icon': 4, 'diagram_image': 1}
+
+
+def optimize_elements(elements: list):
+    """
+    remake_data["elements"] の最適化パス
+    - 透明な図形 / キャンバス外の要素 / 後ろの不透明な矩形に完全に隠れる要素を削除
+    - キャンバスからはみ出した bbox をクランプ
+    - 同じスタイルで縦に隣接するテキストボックスを結合
+    戻り値: ([(元のindex, element), ...], report)
+    元の index はオブジェクトIDや diagram_image の事前生成結果との対応に使う
+    """
+    report = {'input': len(elements), 'invisible': 0, 'offcanvas': 0, 'covered': 0, 'clamped': 0, 'merged_text': 0}
+    before = sum(_estimate_requests(el) for el in elements if isinstance(el, dict))
+
+    items = []
+    for idx, el in enumerate(elements):
+        if not isinstance(el, dict):
+            continue
+        bbox = _parse_bbox(el.get('bbox'))
+        if bbox is None:
+            # 形式不正の bbox は判断できないのでそのまま残す
+            items.append((idx, el))
+            continue
+        if el.get('type') == 'shape' and _opacity(el) < MIN_VISIBLE_OPACITY:
+            report['invisible'] += 1
+            continue
+        clamped = _clamp(bbox)
+        if clamped is None:
+            report['offcanvas'] += 1
+            continue
+        if clamped != bbox:
+            el = dict(el, bbox=list(clamped))
+            report['clamped'] += 1
+        items.append((idx, el))
+
+    items = _drop_covered(items, report)
+    items = _merge_text_runs(items, report)
+
+    after = sum(_estimate_requests(el) for _, el in items)
+    report['output'] = len(items)
+    report['requests_removed'] = before - after
+    return items, report
+
+
+def needs_paragraph_style(el):
+    """ 左揃えは TEXT_BOX の既定値なので updateParagraphStyle は不要 """
+    return str(el.get('align', 'left')).lower() in ('center', 'right', 'justify')
+
+
+# --- 🛠️ Helpers ---
+
+def _estimate_requests(el):
+    n = REQUESTS_PER_TYPE.get(el.get('type'), 0)
+    if el.get('type') == 'text' and not needs_paragraph_style(el):
+        n -= 1
+    return n
+
+def _parse_bbox(bbox):
+    try:
+        x, y, w, h = (float(v) for v in bbox)
+        return (x, y, w, h)
+    except (TypeError, ValueError):
+        return None
+
+def _opacity(el):
+    try:
+        return max(0.0, min(1.0, float(el.get('opacity', 1.0))))
+    except (TypeError, ValueError):
+        return 1.0
+
+def _clamp(bbox):
+    x, y, w, h = bbox
+    if w <= 0 or h <= 0:
+        return None
+    x1, y1 = max(0.0, x), max(0.0, y)
+    x2, y2 = min(CANVAS_W, x + w), min(CANVAS_H, y + h)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2 - x1, y2 - y1)
+
+def _contains(outer, inner):
+    ox, oy, ow, oh = outer
+    ix, iy, iw, ih = inner
+    return ox <= ix and oy <= iy and ix + iw <= ox + ow and iy + ih <= oy + oh
+
+def _is_opaque_rect(el):
+    return el.get('type') == 'shape' and el.get('shape_type', 'RECTANGLE') == 'RECTANGLE' and _opacity(el) >= 1.0
+
+def _drop_covered(items, report):
+    """ 後から描かれる (=上に重なる) 不透明な矩形に完全に覆われる要素を削除 """
+    kept = []
+    for pos, (idx, el) in enumerate(items):
+        bbox = _parse_bbox(el.get('bbox'))
+        covered = bbox is not None and any(
+            _is_opaque_rect(upper) and _contains(_parse_bbox(upper['bbox']), bbox)
+            for _, upper in items[pos + 1:]
+            if _parse_bbox(upper.get('bbox')) is not None
+        )
+        if covered:
+            report['covered'] += 1
+        else:
+            kept.append((idx, el))
+    return kept
+
+def _text_style(el):
+    return (
+        str(el.get('color', '#000000')).lower(),
+        str(el.get('fontSize', 14)),
+        el.get('fontWeight') == 'bold',
+        str(el.get('align', 'left')).lower(),
+    )
+
+def _can_merge(prev, cur):
+    if prev.get('type') != 'text' or cur.get('type') != 'text' or _text_style(prev) != _text_style(cur):
+        return False
+    pb, cb = _parse_bbox(prev.get('bbox')), _parse_bbox(cur.get('bbox'))
+    if pb is None or cb is None:
+        return False
+    try:
+        font_size = float(cur.get('fontSize', 14))
+    except (TypeError, ValueError):
+        return False
+    gap = cb[1] - (pb[1] + pb[3])
+    return (
+        abs(pb[0] - cb[0]) <= MERGE_X_TOLERANCE
+        and abs(pb[2] - cb[2]) <= MERGE_W_TOLERANCE
+        and 0 <= gap <= font_size * MERGE_GAP_RATIO
+    )
+
+def _merge_text_runs(items, report):
+    merged = []
+    for idx, el in items:
+        if merged and _can_merge(merged[-1][1], el):
+            prev_idx, prev = merged[-1]
+            pb, cb = _parse_bbox(prev['bbox']), _parse_bbox(el['bbox'])
+            x, y = min(pb[0], cb[0]), pb[1]
+            w = max(pb[0] + pb[2], cb[0] + cb[2]) - x
+            h = cb[1] + cb[3] - y
+            merged[-1] = (prev_idx, dict(prev, text=f"{prev.get('text', '')}\n{el.get('text', '')}", bbox=[x, y, w, h]))
+            report['merged_text'] += 1
+        else:
+            merged.append((idx, el))
+    return merged
@@ -0,0 +1,250 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# --- 📐 Slides API のルール (送信前にローカルで検証・修復する) ---
+PAGE_W_PT = 720.0
+PAGE_H_PT = 405.0
+# objectId: 5〜50文字, 先頭は英数字か _ , 以降は英数字 / _ / - / :
+OBJECT_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_][a-zA-Z0-9_\-:]{4,49}$')
+OBJECT_ID_MAX_LEN = 50
+# これより小さい要素は拒否されたり潰れたりするので最小サイズまで広げる
+MIN_ELEMENT_SIZE_PT = 1.0
+MIN_TEXT_BOX_PT = 6.0
+MIN_FONT_SIZE_PT = 1.0
+MAX_FONT_SIZE_PT = 400.0
+DEFAULT_FONT_SIZE_PT = 14.0
+MAX_IMAGE_URL_LENGTH = 2000
+VALID_SHAPE_TYPES = {'TEXT_BOX', 'RECTANGLE', 'ROUND_RECTANGLE', 'ELLIPSE'}
+# 画像URLへの到達確認 (HEAD) を行うか。Drive 上の自前アップロードのみなら不要なので既定はオフ
+CHECK_IMAGE_URLS = os.getenv("PREFLIGHT_CHECK_IMAGE_URLS", "0") == "1"
+IMAGE_URL_TIMEOUT_SECONDS = 5
+
+CREATE_REQUESTS = ('createShape', 'createImage')
+ELEMENT_ID_PATTERN = re.compile(r'_el_(\d+)$')
+
+
+def preflight_requests(requests: list, page_id: str, taken_ids: set = None):
+    """
+    _add_remake_requests が組み立てた1スライド分のリクエストを Slides API のルールで検証し、
+    直せるものは修復・直せないものは要素ごと除外する
+    - objectId の形式 / 重複 (同じデッキ内・既存ページ上のIDとの衝突) → 別IDに振り直して参照も追従
+    - サイズ・位置が数値でない / 小さすぎる / ページ外 → 数値化して最小サイズ・ページ内に収める
+    - fontSize / 色 / 透明度の範囲外 → クランプ
+    - 画像URLの形式不正 (任意で到達確認) → その画像要素を除外
+    - 作成されていないオブジェクトへの参照 → 除外
+    taken_ids: 既に使われている objectId の集合 (作成した ID を追加していく)
+    戻り値: (修復済みリクエスト, diagnostics)
+    diagnostics: [{'element': 元のindex or None, 'object_id', 'request', 'issue', 'action'}]
+    """
+    taken_ids = taken_ids if taken_ids is not None else set()
+    diagnostics = []
+    aliases = {}
+    created = {page_id}
+    dropped = set()
+    output = []
+
+    def _report(object_id, request_type, issue, action):
+        match = ELEMENT_ID_PATTERN.search(object_id or '')
+        diagnostics.append({
+            'element': int(match.group(1)) if match else None,
+            'object_id': object_id,
+            'request': request_type,
+            'issue': issue,
+            'action': action,
+        })
+
+    for request in requests:
+        request_type = next(iter(request))
+        body = request[request_type]
+        object_id = body.get('objectId')
+
+        if request_type in CREATE_REQUESTS:
+            new_id = _repair_object_id(object_id, taken_ids)
+            if new_id != object_id:
+                issue = 'duplicate objectId' if object_id in taken_ids else 'invalid objectId'
+                _report(object_id, request_type, issue, f'renamed to {new_id}')
+                aliases[object_id] = new_id
+            else:
+                aliases.pop(object_id, None)
+            body = dict(body, objectId=new_id)
+
+            problem = _check_create(request_type, body, page_id, lambda issue: _report(object_id, request_type, issue, 'repaired'))
+            if problem:
+                _report(object_id, request_type, problem, 'dropped')
+                dropped.add(object_id)
+                continue
+            taken_ids.add(new_id)
+            created.add(new_id)
+            output.append({request_type: body})
+            continue
+
+        # 既存オブジェクトへの操作
+        if object_id in dropped:
+            continue
+        target = aliases.get(object_id, object_id)
+        if target not in created:
+            _report(object_id, request_type, 'references an object that is not created', 'dropped')
+            continue
+        body = dict(body, objectId=target)
+        _repair_update(request_type, body, lambda issue: _report(object_id, request_type, issue, 'repaired'))
+        output.append({request_type: body})
+
+    if diagnostics:
+        logger.info(f"🩺 Preflight {page_id}: {len(diagnostics)} issue(s) fixed before sending")
+    return output, diagnostics
+
+
+def _repair_object_id(object_id, taken_ids):
+    if isinstance(object_id, str) and OBJECT_ID_PATTERN.match(object_id) and object_id not in taken_ids:
+        return object_id
+    candidate = re.sub(r'[^a-zA-Z0-9_\-:]', '_', str(object_id or 'obj'))
+    if not re.match(r'^[a-zA-Z0-9_]', candidate):
+        candidate = f"_{candidate}"
+    if len(candidate) > OBJECT_ID_MAX_LEN:
+        digest = hashlib.sha1(candidate.encode('utf-8')).hexdigest()[:10]
+        candidate = f"{candidate[:OBJECT_ID_MAX_LEN - 11]}_{digest}"
+    candidate = candidate.ljust(5, '_')
+
+    base, n = candidate, 1
+    while candidate in taken_ids:
+        suffix = f"_r{n}"
+        candidate = f"{base[:OBJECT_ID_MAX_LEN - len(suffix)]}{suffix}"
+        n += 1
+    return candidate
+
+
+def _check_create(request_type, body, page_id, repaired):
+    """ 作成リクエストを修復する。修復できない場合は問題の説明を返す """
+    if request_type == 'createShape' and body.get('shapeType') not in VALID_SHAPE_TYPES:
+        repaired(f"unsupported shapeType {body.get('shapeType')!r}")
+        body['shapeType'] = 'RECTANGLE'
+
+    props = body.get('elementProperties') or {}
+    if props.get('pageObjectId') != page_id:
+        return 'pageObjectId does not match the slide'
+
+    min_size = MIN_TEXT_BOX_PT if body.get('shapeType') == 'TEXT_BOX' else MIN_ELEMENT_SIZE_PT
+    size = props.get('size') or {}
+    fixed_size = {}
+    for dim, limit in (('width', PAGE_W_PT), ('height', PAGE_H_PT)):
+        magnitude = _number((size.get(dim) or {}).get('magnitude'))
+        if magnitude is None:
+            repaired(f"non-numeric {dim}")
+            magnitude = min_size
+        elif not min_size <= magnitude <= limit:
+            repaired(f"{dim} {magnitude:g}pt out of range")
+        fixed_size[dim] = {'magnitude': max(min_size, min(limit, magnitude)), 'unit': 'PT'}
+
+    transform = dict(props.get('transform') or {})
+    for axis, limit, dim in (('translateX', PAGE_W_PT, 'width'), ('translateY', PAGE_H_PT, 'height')):
+        value = _number(transform.get(axis, 0))
+        if value is None:
+            repaired(f"non-numeric {axis}")
+            value = 0.0
+        # 要素全体がページ内に収まる位置へ
+        upper = limit - fixed_size[dim]['magnitude']
+        if not 0 <= value <= upper:
+            repaired(f"{axis} {value:g}pt outside the page")
+        transform[axis] = max(0.0, min(upper, value))
+    for axis in ('scaleX', 'scaleY'):
+        if _number(transform.get(axis, 1)) in (None, 0):
+            repaired(f"invalid {axis}")
+            transform[axis] = 1
+    transform['unit'] = 'PT'
+    body['elementProperties'] = dict(props, size=fixed_size, transform=transform)
+
+    if request_type == 'createImage':
+        return _check_image_url(body.get('url'))
+    return None
+
+
+def _repair_update(request_type, body, repaired):
+    if request_type == 'insertText':
+        text = body.get('text')
+        if not isinstance(text, str) or not text:
+            repaired('empty or non-string text')
+            body['text'] = str(text) if text not in (None, '') else ' '
+        body.pop('insertionIndex', None)
+
+    elif request_type == 'updateTextStyle':
+        style = dict(body.get('style') or {})
+        if 'fontSize' in style:
+            magnitude = _number((style['fontSize'] or {}).get('magnitude'))
+            if magnitude is None:
+                repaired('non-numeric fontSize')
+                magnitude = DEFAULT_FONT_SIZE_PT
+            elif not MIN_FONT_SIZE_PT <= magnitude <= MAX_FONT_SIZE_PT:
+                repaired(f"fontSize {magnitude:g}pt out of range")
+            style['fontSize'] = {'magnitude': max(MIN_FONT_SIZE_PT, min(MAX_FONT_SIZE_PT, magnitude)), 'unit': 'PT'}
+        _repair_colors(style, repaired)
+        body['style'] = style
+
+    elif request_type == 'updateShapeProperties':
+        props = dict(body.get('shapeProperties') or {})
+        _repair_colors(props, repaired)
+        body['shapeProperties'] = props
+
+
+def _repair_colors(node, repaired):
+    """ rgbColor の各成分 / alpha を 0.0〜1.0 にクランプ (ネストした dict を再帰的に見る) """
+    for key, value in node.items():
+        if not isinstance(value, dict):
+            continue
+        if key == 'rgbColor':
+            for channel in ('red', 'green', 'blue'):
+                component = _number(value.get(channel, 0))
+                if component is None or not 0 <= component <= 1:
+                    repaired(f"color {channel} out of range")
+                    value[channel] = max(0.0, min(1.0, component or 0.0))
+            continue
+        if 'alpha' in value:
+            alpha = _number(value['alpha'])
+            if alpha is None or not 0 <= alpha <= 1:
+                repaired('alpha out of range')
+                value['alpha'] = 1.0 if alpha is None else max(0.0, min(1.0, alpha))
+        _repair_colors(value, repaired)
+
+
+def _check_image_url(url):
+    if not isinstance(url, str) or not url.startswith(('https://', 'http://')):
+        return 'image url is not http(s)'
+    if len(url) > MAX_IMAGE_URL_LENGTH:
+        return f'image url longer than {MAX_IMAGE_URL_LENGTH} characters'
+    if CHECK_IMAGE_URLS and not _url_reachable(url):
+        return 'image url is not reachable'
+    return None
+
+
+_reachable_cache = {}
+_reachable_lock = threading.Lock()
+
+def _url_reachable(url):
+    with _reachable_lock:
+        if url in _reachable_cache:
+            return _reachable_cache[url]
+    import httplib2
+    try:
+        response, _ = httplib2.Http(timeout=IMAGE_URL_TIMEOUT_SECONDS).request(url, 'HEAD')
+        ok = response.status < 400
+    except Exception as e:
+        logger.warning(f"⚠️ Image url check failed: {e}")
+        ok = False
+    with _reachable_lock:
+        if len(_reachable_cache) >= 1024:
+            _reachable_cache.clear()
+        _reachable_cache[url] = ok
+    return ok
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
@@ -0,0 +1,171 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+# --- 📐 Gemini 構造化出力スキーマ (response_schema) ---
+
+DRAFT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "slides": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "content": {"type": "string"},
+                    "visual_prompt": {"type": "string"},
+                },
+                "required": ["title", "content", "visual_prompt"],
+            },
+        },
+    },
+    "required": ["slides"],
+}
+
+LAYOUT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "background_color": {"type": "string"},
+        "elements": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": ["text", "shape", "icon", "diagram_image"]},
+                    "bbox": {"type": "array", "items": {"type": "number"}},
+                    "text": {"type": "string"},
+                    "color": {"type": "string"},
+                    "fontSize": {"type": "number"},
+                    "fontWeight": {"type": "string", "enum": ["bold", "normal"]},
+                    "align": {"type": "string", "enum": ["left", "center", "right"]},
+                    "shape_type": {"type": "string", "enum": ["RECTANGLE", "ROUND_RECTANGLE", "ELLIPSE"]},
+                    "opacity": {"type": "number"},
+                    "icon_name": {"type": "string"},
+                    "prompt": {"type": "string"},
+                },
+                "required": ["type", "bbox"],
+            },
+        },
+    },
+    "required": ["background_color", "elements"],
+}
+
+# 複数画像をまとめて解析する場合: 画像ごとの結果を image_index 付きで並べる
+LAYOUT_BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "slides": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"image_index": {"type": "integer"}, **LAYOUT_RESPONSE_SCHEMA["properties"]},
+                "required": ["image_index", "background_color", "elements"],
+            },
+        },
+    },
+    "required": ["slides"],
+}
+
+# --- 🧾 Typed Models (pydantic-core で JSON を直接検証) ---
+
+class DraftSlide(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    title: str = ""
+    content: str = ""
+    visual_prompt: str = ""
+
+
+class DraftResponse(BaseModel):
+    slides: List[DraftSlide] = []
+
+
+class LayoutElement(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    type: str
+    bbox: List[float]
+    text: Optional[str] = None
+    color: Optional[str] = None
+    fontSize: Optional[float] = None
+    fontWeight: Optional[str] = None
+    align: Optional[str] = None
+    shape_type: Optional[str] = None
+    opacity: Optional[float] = None
+    icon_name: Optional[str] = None
+    prompt: Optional[str] = None
+
+
+class LayoutResponse(BaseModel):
+    background_color: str = "#FFFFFF"
+    elements: List[LayoutElement] = []
+
+
+class BatchLayoutItem(LayoutResponse):
+    image_index: int
+
+
+class BatchLayoutResponse(BaseModel):
+    slides: List[BatchLayoutItem] = []
+
+
+# --- 🌐 API Responses (response_model: FastAPI が pydantic-core で直接 JSON バイト列にする) ---
+
+class DraftResult(BaseModel):
+    status: str
+    data: DraftResponse
+    speculation_id: Optional[str] = None
+
+
+class SlideLayout(BaseModel):
+    """ 解析結果のレイアウト (寛容なパースにフォールバックした結果もそのまま返せるよう要素は dict) """
+    model_config = ConfigDict(extra="allow")
+
+    background_color: str = "#FFFFFF"
+    elements: List[Dict[str, Any]] = []
+
+
+class LayoutResult(BaseModel):
+    status: str
+    layout: SlideLayout
+
+
+class BatchLayoutResult(BaseModel):
+    status: str
+    layouts: List[SlideLayout]
+
+
+class ExportChanges(BaseModel):
+    rendered: int
+    removed: int
+    moved: int
+    unchanged: int
+
+
+class SlideDiagnostics(BaseModel):
+    index: int
+    diagnostics: List[Dict[str, Any]]
+
+
+class ExportResult(BaseModel):
+    status: str
+    url: str
+    presentation_id: Optional[str] = None
+    changes: Optional[ExportChanges] = None
+    diagnostics: Optional[List[SlideDiagnostics]] = None
+
+
+class ExportJobAccepted(BaseModel):
+    status: str
+    job_id: str
+
+
+class ExportJobStatus(BaseModel):
+    id: str
+    status: str
+    title: str
+    total: int
+    rendered: int
+    events: List[Dict[str, Any]]
+    error: Optional[str] = None
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from services import ai_service
+
+logger = logging.getLogger(__name__)
+
+# --- 🔮 Speculative Image Generation ---
+# 構成案 (Step 1) の visual_prompt をユーザーが Step 2 で読んでいる間に先回りで生成しておく
+SPECULATIVE_IMAGE_CONCURRENCY = int(os.getenv("SPECULATIVE_IMAGE_CONCURRENCY", "2"))
+SPECULATION_TTL_SECONDS = int(os.getenv("SPECULATION_TTL_SECONDS", "1800"))
+MAX_SPECULATIONS = int(os.getenv("MAX_SPECULATIONS", "50"))
+MAX_PROMPTS_PER_SPECULATION = 20
+
+
+class SpeculativeImages:
+    """
+    セッション (= 1回の構成案) ごとに visual_prompt の画像生成をバックグラウンドで進める
+    - 生成結果は通常の画像キャッシュ (ai_service.image_cache) に入るので、Step 3 はキャッシュヒットで即答
+      (画像そのものはメモリに持たない)
+    - 生成中のプロンプトに Step 3 が来た場合は同じタスクの完了を待つ (二重生成しない)
+    - プロンプトが編集されたら古いプロンプトのタスクをキャンセル (Step 3 が待っている場合を除く)
+      キャッシュはプロンプト内容がキーなので、編集後のプロンプトに古い画像が返ることはない
+    イベントループ上で動かす前提 (スレッドセーフではない)
+    """
+
+    def __init__(self, max_concurrency=SPECULATIVE_IMAGE_CONCURRENCY, ttl_seconds=SPECULATION_TTL_SECONDS, max_sessions=MAX_SPECULATIONS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._semaphore = None
+        self._sessions = OrderedDict()  # session_id -> {'created_at', 'prompts': {index: prompt}}
+        self._tasks = {}                # image cache key -> asyncio.Task
+        self._waiters = {}              # image cache key -> Step 3 側で待っている数
+
+    # --- Session API ---
+
+    def start(self, prompts=()):
+        """ 新しいセッションを作り、prompts の生成を開始する。session_id を返す """
+        self._purge()
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = {'created_at': time.time(), 'prompts': {}}
+        for index, prompt in enumerate(prompts):
+            self.add(session_id, index, prompt)
+        return session_id
+
+    def add(self, session_id, index, prompt):
+        """ 1枚分を追加 (ストリーミング中に構成案が1枚届くたびに呼ぶ) """
+        session = self._sessions.get(session_id)
+        if session is None or index >= MAX_PROMPTS_PER_SPECULATION or not (prompt or "").strip():
+            return
+        session['prompts'][index] = prompt
+        self._schedule(prompt)
+
+    def update(self, session_id, prompts):
+        """
+        編集後のプロンプト一覧で置き換える
+        変わっていないプロンプトはそのまま、消えた / 変わったプロンプトは取り消して新しい方を生成する
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        old_keys = {self._key(p) for p in session['prompts'].values()}
+        session['prompts'] = {}
+        for index, prompt in enumerate(prompts):
+            self.add(session_id, index, prompt)
+        new_keys = {self._key(p) for p in session['prompts'].values()}
+        self._release(old_keys - new_keys)
+
+    def cancel(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise KeyError(session_id)
+        self._release({self._key(p) for p in session['prompts'].values()})
+
+    def status(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        slides = []
+        for index, prompt in sorted(session['prompts'].items()):
+            task = self._tasks.get(self._key(prompt))
+            if task is None:
+                state = 'done'
+            elif not task.done():
+                state = 'running'
+            else:
+                state = 'failed' if _failed(task) else 'done'
+            slides.append({'index': index, 'status': state})
+        return {'speculation_id': session_id, 'slides': slides}
+
+    # --- Step 3 ---
+
+    async def wait_for(self, prompt):
+        """
+        先回り生成中ならその完了を待つ (この後の通常の生成はキャッシュヒットになる)
+        生成できていれば True。対象外 / 失敗 / キャンセルなら False
+        """
+        key = self._key(prompt)
+        task = self._tasks.get(key)
+        if task is None:
+            return False
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            if not task.done():
+                logger.info("🔮 Waiting for speculative image already in progress")
+            await asyncio.wait({task})
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+        return not _failed(task)
+
+    def shutdown(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._sessions.clear()
+
+    # --- Internals ---
+
+    @staticmethod
+    def _key(prompt):
+        return ai_service._image_cache_key(prompt)
+
+    def _schedule(self, prompt):
+        key = self._key(prompt)
+        task = self._tasks.get(key)
+        if task is not None and not _failed(task):
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks[key] = asyncio.ensure_future(self._generate(prompt))
+
+    async def _generate(self, prompt):
+        async with self._semaphore:
+            # キャッシュ済みならモデルは呼ばれない
+            return await ai_service.generate_image_bytes_async(prompt) is not None
+
+    def _release(self, keys):
+        """ どのセッションからも参照されなくなったプロンプトのタスクを片付ける """
+        still_used = {self._key(p) for s in self._sessions.values() for p in s['prompts'].values()}
+        for key in keys - still_used:
+            task = self._tasks.get(key)
+            if task is None or self._waiters.get(key):
+                continue
+            if not task.done():
+                task.cancel()
+            del self._tasks[key]
+
+    def _purge(self):
+        """ 期限切れ / 上限超過のセッションを古い順に捨てる """
+        now = time.time()
+        expired = [sid for sid, s in self._sessions.items() if now - s['created_at'] > self.ttl_seconds]
+        overflow = max(0, len(self._sessions) - len(expired) - self.max_sessions + 1)
+        expired += [sid for sid in self._sessions if sid not in expired][:overflow]
+        for session_id in expired:
+            self.cancel(session_id)
+        # 完了したタスクで参照されなくなったものも捨てる (結果は画像キャッシュに残っている)
+        self._release({key for key, task in self._tasks.items() if task.done()})
+
+
+def _failed(task):
+    return task.done() and (task.cancelled() or task.exception() is not None or not task.result())
+
+
+speculative_images = SpeculativeImages()
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from services.disk_cache import CACHE_DIR
+
+# --- 🗂️ アップロード済み画像のインデックス (内容ハッシュ → Drive ファイル) ---
+UPLOAD_INDEX_PATH = os.getenv("UPLOAD_INDEX_PATH", os.path.join(CACHE_DIR, "upload_index.sqlite3"))
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+def stream_hash(stream):
+    """ ファイルライクをチャンク単位で読んでハッシュ化 (読み終えたら先頭に戻す) """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class UploadIndex:
+    """
+    (ユーザー, 画像バイトの SHA-256) → file_id を SQLite に保存する
+    同じ画像を再エクスポートした時は Drive への転送を省略して既存ファイルを再利用する
+    ※ thumbnailLink は数時間で失効するので URL は保存しない (再利用時に files().get で取り直す)
+    """
+
+    def __init__(self, path=UPLOAD_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            # 旧 uploads テーブル (失効する URL を保存していた) は使わない
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_files ("
+                " user_id TEXT NOT NULL, digest TEXT NOT NULL,"
+                " file_id TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (user_id, digest))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, user_id: str, digest: str):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT file_id FROM upload_files WHERE user_id = ? AND digest = ?", (user_id, digest)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, user_id: str, digest: str, file_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_files (user_id, digest, file_id, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, digest, file_id, time.time()),
+            )
+            conn.commit()
+
+    def forget_file(self, file_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM upload_files WHERE file_id = ?", (file_id,))
+            conn.commit()
+
+
+upload_index = UploadIndex()
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+
+from services import ai_service, client_cache, image_pipeline
+from services.executor import get_executor
+from services.metrics import record_startup
+
+logger = logging.getLogger(__name__)
+
+# --- 🔥 Warm-up / Readiness ---
+# 起動直後にバックグラウンドでウォームアップし、完了するまで /api/ready は 503 を返す
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+# Gemini への接続確立 (モデル情報の取得 = API 呼び出し1回) までウォームアップに含めるか
+WARMUP_NETWORK = os.getenv("WARMUP_NETWORK", "0") == "1"
+
+
+def _warm_genai():
+    ai_service._genai()
+
+def _warm_google_clients():
+    client_cache.warm_up()
+    from google.oauth2.credentials import Credentials  # noqa: F401  (google.auth の import を済ませる)
+    from googleapiclient.http import MediaIoBaseUpload  # noqa: F401
+
+def _warm_gemini_connection():
+    ai_service._genai().get_model(ai_service.TEXT_MODEL_NAME)
+
+
+WARMUP_STEPS = [
+    ("genai", _warm_genai),
+    ("google_clients", _warm_google_clients),
+    ("image_pipeline", image_pipeline.warm_up),
+    ("executor", get_executor),
+]
+NETWORK_STEPS = [
+    ("gemini_connection", _warm_gemini_connection),
+]
+
+
+class Warmup:
+    """
+    重い SDK の読み込み・静的 discovery ドキュメントのパース・スレッドプールの起動を
+    最初のリクエストより前に済ませる。何度呼んでも実行は1回 (失敗したステップは再実行可)
+    実行中かどうかは in_progress で別に持つ (一度 ready になったら再実行中も ready のまま)
+    """
+
+    def __init__(self):
+        self.status = "cold"  # cold / ready / failed
+        self.in_progress = False
+        self.steps = {}       # name -> {'seconds', 'ok', 'error'}
+        self.total_seconds = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start_background(self, network: bool = WARMUP_NETWORK):
+        threading.Thread(target=self.run, args=(network,), name="warmup", daemon=True).start()
+
+    def run(self, network: bool = False):
+        with self._lock:
+            owner = not self.in_progress
+            if owner:
+                self.in_progress = True
+                self._done.clear()
+        if not owner:
+            self._done.wait()
+            return self.report()
+
+        start = time.perf_counter()
+        steps = WARMUP_STEPS + (NETWORK_STEPS if network else [])
+        for name, func in steps:
+            if self.steps.get(name, {}).get("ok"):
+                continue
+            step_start = time.perf_counter()
+            try:
+                func()
+                self.steps[name] = {"ok": True}
+            except Exception as e:
+                logger.warning(f"⚠️ Warm-up step {name} failed: {e}")
+                self.steps[name] = {"ok": False, "error": str(e)}
+            self.steps[name]["seconds"] = time.perf_counter() - step_start
+            record_startup(f"warmup_{name}", self.steps[name]["seconds"])
+
+        self.total_seconds = time.perf_counter() - start
+        record_startup("warmup_total", self.total_seconds)
+        # ネットワークのステップはベストエフォート (失敗しても ready)
+        required = {name for name, _ in WARMUP_STEPS}
+        ok = all(self.steps[name]["ok"] for name in required)
+        with self._lock:
+            if ok or self.status == "ready":
+                self.status = "ready"
+            else:
+                self.status = "failed"
+            self.in_progress = False
+            self._done.set()
+        return self.report()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def report(self):
+        return {"status": self.status, "in_progress": self.in_progress, "total_seconds": self.total_seconds, "steps": dict(self.steps)}
+
+
+warmup = Warmup()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# backend/ を import パスに入れる (services.* をそのまま import できるように)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
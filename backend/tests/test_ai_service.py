@@ -0,0 +1,33 @@
+import json
+
+from services.ai_service import _parse_remake_batch_response
+
+
+def _reply(*indices):
+    return json.dumps({"slides": [
+        {"image_index": i, "elements": [{"type": "text", "content": f"IMG{i}", "bbox": [0, 0, 10, 10]}]}
+        for i in indices
+    ]})
+
+
+def _contents(layouts):
+    return {index: layout["elements"][0]["content"] for index, layout in layouts.items()}
+
+
+def test_zero_based_reply():
+    assert _contents(_parse_remake_batch_response(_reply(0, 1, 2), 3)) == {0: "IMG0", 1: "IMG1", 2: "IMG2"}
+
+
+def test_one_based_reply_is_shifted():
+    assert _contents(_parse_remake_batch_response(_reply(1, 2, 3), 3)) == {0: "IMG1", 1: "IMG2", 2: "IMG3"}
+
+
+def test_partial_zero_based_reply_is_not_shifted():
+    # 画像 0 だけ抜けた 0 始まりの応答: 残りはそのままの位置、0 は個別解析へ回す
+    layouts = _parse_remake_batch_response(_reply(1, 2), 3)
+    assert _contents(layouts) == {1: "IMG1", 2: "IMG2"}
+
+
+def test_out_of_range_and_duplicate_indices_are_dropped():
+    layouts = _parse_remake_batch_response(_reply(0, 0, 5, -1), 3)
+    assert _contents(layouts) == {0: "IMG0"}